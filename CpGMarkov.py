@@ -1,8 +1,11 @@
 #Alan Pacheco
 #Generate random sequences from M1, M2 and calculate probabilities of coming from M1, M2.
 
+import sys
 import random
 
+import numpy
+
 states = ('A','C','G','T')
 start_probability = {'A': 0.25, 'C': 0.25,'G':0.25,'T':0.25}
  
@@ -33,7 +36,7 @@ emission_probability = {
 def SelectNuc(d):
     r = random.random()
     s = 0.0
-    for k, w in d.iteritems():
+    for k, w in d.items():
         s += w
         if r < s: #if the random number is less than the next cumulative probability
         	return k
@@ -58,28 +61,60 @@ def calc_prob(chain, trans_p, em_p):
 		prob *= trans_p[letter][nextletter] * em_p[letter][letter]
 	return prob
 
-M1_or_m2 = []
-trials = 10000
-for i in range(trials):
-	chain = makechain(states,start_probability,M1_transition_probability)
-	M1_prob = calc_prob(chain,M1_transition_probability,emission_probability)
-	M2_prob = calc_prob(chain,M2_transition_probability,emission_probability)
-	if M1_prob < M2_prob:
-		M1_or_m2.append(1)
-	else:
-		M1_or_m2.append(0)
-
-print 'Part a: M2 probability is higher than M1 probability',sum(M1_or_m2),'out of',trials,'times.'
-
-M1_or_m2 = []
-trials = 10000
-for i in range(trials):
-	chain = makechain(states,start_probability,M2_transition_probability)
-	M1_prob = calc_prob(chain,M1_transition_probability,emission_probability)
-	M2_prob = calc_prob(chain,M2_transition_probability,emission_probability)
-	if M1_prob > M2_prob:
-		M1_or_m2.append(1)
-	else:
-		M1_or_m2.append(0)
-
-print 'Part b: M1 probability is higher than M2 probability',sum(M1_or_m2),'out of',trials,'times.'
\ No newline at end of file
+#Vectorized sampling and scoring. Chains are (trials x length) arrays of
+#indices into states, generated a column at a time for all trials at once.
+
+#Return a dict of probabilities as a vector, or a dict of dicts as a matrix, in the order of states
+def prob_array(p):
+	if isinstance(p[states[0]], dict):
+		return numpy.array([[p[a][b] for b in states] for a in states], dtype=float)
+	return numpy.array([p[a] for a in states], dtype=float)
+
+#Cumulative probabilities along the last axis, the last one forced to 1 against rounding
+def cumulative(p):
+	cum = numpy.cumsum(p, axis=-1)
+	cum[..., -1] = 1.0
+	return cum
+
+#Generate trials chains of the given length at once from a seeded numpy Generator
+def sample_chains(starts, p_trans, trials, length=chain_length, rng=None):
+	if rng is None or isinstance(rng, int):
+		rng = numpy.random.default_rng(rng)
+	cum_start = cumulative(prob_array(starts))
+	cum_trans = cumulative(prob_array(p_trans))
+	chains = numpy.empty((trials, length), dtype=numpy.uint8)
+	if length == 0:
+		return chains
+	chains[:,0] = numpy.searchsorted(cum_start, rng.random(trials), side='right')
+	for i in range(1, length):
+		#the next nucleotide is the number of cumulative probabilities below the random number
+		cum = cum_trans[chains[:,i-1]]
+		chains[:,i] = (rng.random(trials)[:,None] >= cum[:,:-1]).sum(axis=1)
+	return chains
+
+#Log probability of every chain (like calc_prob, without the start probability)
+def log_prob(chains, p_trans):
+	with numpy.errstate(divide='ignore'):
+		log_trans = numpy.log(prob_array(p_trans))
+	return log_trans[chains[:,:-1], chains[:,1:]].sum(axis=1)
+
+#Sample trials chains from source_trans in blocks and count how often model_a scores below model_b
+def count_lower(source_trans, model_a, model_b, trials, rng=None, block=1 << 20):
+	if rng is None or isinstance(rng, int):
+		rng = numpy.random.default_rng(rng)
+	count = 0
+	for done in range(0, trials, block):
+		chains = sample_chains(start_probability, source_trans, min(block, trials - done), chain_length, rng)
+		count += int(numpy.count_nonzero(log_prob(chains, model_a) < log_prob(chains, model_b)))
+	return count
+
+if __name__ == "__main__":
+	trials = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+	seed = int(sys.argv[2]) if len(sys.argv) > 2 else None
+	rng = numpy.random.default_rng(seed)
+
+	lower = count_lower(M1_transition_probability,M1_transition_probability,M2_transition_probability,trials,rng)
+	print('Part a: M2 probability is higher than M1 probability',lower,'out of',trials,'times.')
+
+	lower = count_lower(M2_transition_probability,M2_transition_probability,M1_transition_probability,trials,rng)
+	print('Part b: M1 probability is higher than M2 probability',lower,'out of',trials,'times.')
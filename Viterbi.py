@@ -1,6 +1,8 @@
 """ Simple implementation of Viterbi algorithm for protein secondary structure
 prediction. BE 562 course. """
 
+import numpy
+
 states = ('Helix','Sheet','Turn ','Other')
 start_probability = {'Helix': 0.0, 'Sheet': 0.0,'Turn ':0.0,'Other':1.0}
  
@@ -71,13 +73,190 @@ def forward(obs, states, start_p, trans_p, emit_p):
       for tempstate in states:
         probs.append(f[t-1][tempstate] * trans_p[tempstate][state] * emit_p[state][obs[t]])
       f[t][state] = sum(probs)
-    
-    #Termination
-    for state in states:
-      P = P+f[t][state]
+
+  #Termination
+  for state in states:
+    P = P+f[-1][state]
 
   return ('Total P'+str(obs)+' = '+str(P))
 
-observations = ('M', 'L', 'A','E')
-print viterbi(observations,states,start_probability,transition_probability,emission_probability)
-print forward(observations,states,start_probability,transition_probability,emission_probability)
\ No newline at end of file
+
+# Log-space engine. The model is held as NumPy arrays of log probabilities
+# (log(0) = -inf), so long observation sequences do not underflow, and each
+# time step is a vectorized max/argmax or log-sum-exp over the states.
+
+def model_arrays(states, start_p, trans_p, emit_p, symbols=None):
+  """Return symbols and the log start, transition and emission arrays of a
+  dict model. Rows and columns follow the order of states and symbols."""
+  if symbols is None:
+    symbols = sorted(set(o for state in states for o in emit_p[state]))
+  with numpy.errstate(divide='ignore'):
+    log_start = numpy.log(numpy.array([start_p[s] for s in states], dtype=float))
+    log_trans = numpy.log(numpy.array([[trans_p[s][r] for r in states] for s in states], dtype=float))
+    log_emit = numpy.log(numpy.array([[emit_p[s].get(o, 0.0) for o in symbols] for s in states], dtype=float))
+  return tuple(symbols), log_start, log_trans, log_emit
+
+def encode_obs(obs, symbols):
+  """Return the observations as an array of indices into symbols."""
+  index = dict((o, i) for i, o in enumerate(symbols))
+  return numpy.array([index[o] for o in obs], dtype=numpy.intp)
+
+def viterbi_engine(obs_idx, log_start, log_trans, log_emit):
+  """Log-space Viterbi on encoded observations. Returns the log probability
+  of the best path and the path as an array of state indices. Backpointers
+  are kept in a T x S array, so memory and traceback are O(T)."""
+  T = len(obs_idx)
+  S = len(log_start)
+  emit = log_emit[:, obs_idx].T  # emission log probability per time step
+  back = numpy.zeros((T, S), dtype=numpy.int8 if S < 128 else numpy.int32)
+  columns = numpy.arange(S)
+
+  v = log_start + emit[0]
+  for t in range(1, T):
+    scores = v[:, None] + log_trans  # from state (rows) to state (columns)
+    back[t] = scores.argmax(axis=0)
+    v = scores[back[t], columns] + emit[t]
+
+  path = numpy.empty(T, dtype=numpy.intp)
+  path[-1] = v.argmax()
+  for t in range(T-1, 0, -1):
+    path[t-1] = back[t, path[t]]
+  return float(v[path[-1]]), path
+
+def forward_engine(obs_idx, log_start, log_trans, log_emit):
+  """Log-space forward algorithm on encoded observations. Returns the log
+  probability of the observations and the T x S array of forward log
+  probabilities, using log-sum-exp at every time step."""
+  T = len(obs_idx)
+  emit = log_emit[:, obs_idx].T
+  trans = numpy.exp(log_trans)
+  f = numpy.empty((T, len(log_start)))
+
+  f[0] = log_start + emit[0]
+  for t in range(1, T):
+    top = f[t-1].max()
+    if top == -numpy.inf:
+      f[t:] = -numpy.inf
+      break
+    with numpy.errstate(divide='ignore'):
+      f[t] = numpy.log(numpy.exp(f[t-1] - top).dot(trans)) + top + emit[t]
+
+  top = f[-1].max()
+  if top == -numpy.inf:
+    return float(top), f
+  return float(top + numpy.log(numpy.exp(f[-1] - top).sum())), f
+
+def viterbi_log(obs, states, start_p, trans_p, emit_p):
+  """viterbi in log space for dict models. Returns the log probability of
+  the best path and the list of its states."""
+  symbols, log_start, log_trans, log_emit = model_arrays(states, start_p, trans_p, emit_p)
+  logprob, path = viterbi_engine(encode_obs(obs, symbols), log_start, log_trans, log_emit)
+  return logprob, [states[i] for i in path]
+
+def forward_log(obs, states, start_p, trans_p, emit_p):
+  """forward in log space for dict models. Returns log P(obs)."""
+  symbols, log_start, log_trans, log_emit = model_arrays(states, start_p, trans_p, emit_p)
+  return forward_engine(encode_obs(obs, symbols), log_start, log_trans, log_emit)[0]
+
+
+# Scaled forward/backward (Durbin p.78) over batches of sequences. A batch is
+# a B x T array of encoded observations padded to the longest sequence, with
+# the true lengths alongside; every time step is vectorized over sequences
+# and states. Padded positions have scale 1 and posterior 0.
+
+def pad_batch(sequences, symbols):
+  """Encode sequences of observations into a B x T index array padded with
+  symbol 0, and return it with the array of lengths."""
+  lengths = numpy.array([len(seq) for seq in sequences], dtype=numpy.intp)
+  obs = numpy.zeros((len(sequences), lengths.max() if len(sequences) else 0), dtype=numpy.intp)
+  for b, seq in enumerate(sequences):
+    obs[b, :len(seq)] = encode_obs(seq, symbols)
+  return obs, lengths
+
+def forward_scaled(obs, lengths, start, trans, emit):
+  """Scaled forward pass with probabilities (not logs) start, trans and
+  emit. Returns alpha (B x T x S, each column summing to 1), the scaling
+  factors (B x T) and the log likelihood of each sequence, the sum of the
+  log scaling factors (-inf for impossible sequences)."""
+  B, T = obs.shape
+  E = emit[:, obs].transpose(1, 2, 0)  # B x T x S
+  active = numpy.arange(T) < lengths[:, None]  # B x T
+  alpha = numpy.zeros((B, T, len(start)))
+  scale = numpy.ones((B, T))
+  # a sequence is impossible from the first position where c == 0 on; its
+  # alpha stays 0 and its later scales 1 so that nothing turns into 0/0
+  impossible = numpy.zeros(B, dtype=bool)
+
+  a = start * E[:, 0]
+  for t in range(T):
+    if t > 0:
+      a = alpha[:, t-1].dot(trans) * E[:, t]
+    c = numpy.where(active[:, t] & ~impossible, a.sum(axis=1), 1.0)
+    scale[:, t] = c
+    impossible |= c == 0
+    alpha[:, t] = numpy.where(active[:, t, None], a / numpy.where(c == 0, 1.0, c)[:, None],
+                              alpha[:, t-1] if t else 0.0)
+    alpha[impossible, t] = 0.0
+  with numpy.errstate(divide='ignore'):
+    loglik = numpy.log(scale).sum(axis=1)
+  loglik[impossible] = -numpy.inf
+  return alpha, scale, loglik
+
+def backward_scaled(obs, lengths, trans, emit, scale):
+  """Scaled backward pass matching forward_scaled. Returns beta (B x T x S),
+  1 from the last position of each sequence on."""
+  B, T = obs.shape
+  E = emit[:, obs].transpose(1, 2, 0)
+  beta = numpy.ones((B, T, trans.shape[0]))
+
+  for t in range(T-2, -1, -1):
+    c = scale[:, t+1, None]
+    b = (E[:, t+1] * beta[:, t+1]).dot(trans.T) / numpy.where(c == 0, 1.0, c)
+    inside = (t+1 < lengths)[:, None]
+    beta[:, t] = numpy.where(inside, b, 1.0)
+  return beta
+
+def forward_backward_engine(obs, lengths, start, trans, emit):
+  """Forward and backward on a padded batch. Returns the log likelihoods
+  (B), the scaling factors (B x T) and the posterior state probabilities
+  (B x T x S, zero at padded positions)."""
+  alpha, scale, loglik = forward_scaled(obs, lengths, start, trans, emit)
+  beta = backward_scaled(obs, lengths, trans, emit, scale)
+  active = numpy.arange(obs.shape[1]) < lengths[:, None]
+  return loglik, scale, alpha * beta * active[:, :, None]
+
+def forward_backward(sequences, states, start_p, trans_p, emit_p, batch_size=1024):
+  """Forward/backward for many observation sequences of a dict model.
+  Sequences are processed in batches of similar length. Returns the array
+  of log likelihoods and, per sequence, its scaling factors (T) and
+  posterior state probabilities (T x S, columns in the order of states)."""
+  symbols, log_start, log_trans, log_emit = model_arrays(states, start_p, trans_p, emit_p)
+  start, trans, emit = numpy.exp(log_start), numpy.exp(log_trans), numpy.exp(log_emit)
+
+  loglik = numpy.zeros(len(sequences))
+  scales = [None] * len(sequences)
+  posteriors = [None] * len(sequences)
+  order = sorted(range(len(sequences)), key=lambda i: len(sequences[i]))
+  for first in range(0, len(order), batch_size):
+    batch = order[first:first+batch_size]
+    obs, lengths = pad_batch([sequences[i] for i in batch], symbols)
+    ll, scale, post = forward_backward_engine(obs, lengths, start, trans, emit)
+    for k, i in enumerate(batch):
+      loglik[i] = ll[k]
+      scales[i] = scale[k, :lengths[k]]
+      posteriors[i] = post[k, :lengths[k]]
+  return loglik, scales, posteriors
+
+def posterior_decoding(sequences, states, start_p, trans_p, emit_p):
+  """Return, for each sequence, the list of most probable states position
+  by position according to the posterior probabilities."""
+  loglik, scales, posteriors = forward_backward(sequences, states, start_p, trans_p, emit_p)
+  return [[states[i] for i in post.argmax(axis=1)] for post in posteriors]
+
+if __name__ == "__main__":
+  observations = ('M', 'L', 'A','E')
+  print(viterbi(observations,states,start_probability,transition_probability,emission_probability))
+  print(forward(observations,states,start_probability,transition_probability,emission_probability))
+  print(viterbi_log(observations,states,start_probability,transition_probability,emission_probability))
+  print(forward_log(observations,states,start_probability,transition_probability,emission_probability))
+  print(posterior_decoding([observations],states,start_probability,transition_probability,emission_probability))
\ No newline at end of file
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+
+""" Baum-Welch training (Durbin p.64) for the HMMs of Viterbi.py. The E-step
+runs the scaled forward/backward of Viterbi.py on shards of the training
+sequences in a pool of processes; the expected counts of the shards are
+summed for the M-step. Parameters can be checkpointed after every iteration
+and training resumed from the checkpoint. """
+
+import os
+import sys
+import multiprocessing
+
+import numpy
+
+import fasta
+from Viterbi import (model_arrays, forward_scaled, backward_scaled,
+                     states, start_probability, transition_probability,
+                     emission_probability)
+
+
+def expected_counts(obs, lengths, start, trans, emit):
+  """E-step for one padded batch. Returns the expected start, transition
+  (S x S) and emission (S x K) counts, the summed log likelihood and the
+  number of sequences skipped because the model gives them probability 0."""
+  alpha, scale, loglik = forward_scaled(obs, lengths, start, trans, emit)
+  possible = numpy.isfinite(loglik)
+  skipped = int((~possible).sum())
+  if skipped:
+    obs, lengths, alpha, scale, loglik = (obs[possible], lengths[possible], alpha[possible],
+                                          scale[possible], loglik[possible])
+  beta = backward_scaled(obs, lengths, trans, emit, scale)
+
+  T = obs.shape[1]
+  S, K = emit.shape
+  active = (numpy.arange(T) < lengths[:, None])[:, :, None]
+  gamma = alpha * beta * active
+
+  # xi_t(i,j) = alpha_t(i) a_ij e_j(x_t+1) beta_t+1(j) / c_t+1, summed over t
+  E = emit[:, obs].transpose(1, 2, 0)
+  w = E[:, 1:] * beta[:, 1:] / scale[:, 1:, None] * active[:, 1:]
+  trans_counts = trans * numpy.einsum('bti,btj->ij', alpha[:, :-1], w)
+
+  emit_counts = numpy.empty((S, K))
+  flat_obs = obs.ravel()
+  for s in range(S):
+    emit_counts[s] = numpy.bincount(flat_obs, weights=gamma[:, :, s].ravel(), minlength=K)
+
+  return gamma[:, 0].sum(axis=0), trans_counts, emit_counts, loglik.sum(), skipped
+
+
+def shard_counts(shard, start, trans, emit, batch_size=256):
+  """E-step over a shard of encoded sequences, in batches of similar
+  length. Returns the same tuple as expected_counts, summed."""
+  S, K = emit.shape
+  totals = [numpy.zeros(S), numpy.zeros((S, S)), numpy.zeros((S, K)), 0.0, 0]
+  order = sorted(range(len(shard)), key=lambda i: len(shard[i]))
+  for first in range(0, len(order), batch_size):
+    batch = [shard[i] for i in order[first:first+batch_size]]
+    lengths = numpy.array([len(seq) for seq in batch], dtype=numpy.intp)
+    obs = numpy.zeros((len(batch), lengths.max()), dtype=numpy.intp)
+    for b, seq in enumerate(batch):
+      obs[b, :len(seq)] = seq
+    for k, value in enumerate(expected_counts(obs, lengths, start, trans, emit)):
+      totals[k] = totals[k] + value
+  return tuple(totals)
+
+
+# Training shards of a worker process, set once by the pool initializer so
+# that each iteration only sends the current parameters
+_shards = None
+
+def _init_worker(shards):
+  global _shards
+  _shards = shards
+
+def _shard_job(args):
+  index, start, trans, emit, batch_size = args
+  return shard_counts(_shards[index], start, trans, emit, batch_size)
+
+
+def mstep(counts, old, pseudocount=0.0):
+  """Normalise expected counts into probabilities. Rows without any counts
+  (states never visited) keep their old values."""
+  counts = counts + pseudocount
+  totals = counts.sum(axis=-1, keepdims=True)
+  with numpy.errstate(invalid='ignore', divide='ignore'):
+    new = counts / totals
+  return numpy.where(totals > 0, new, old)
+
+
+def baum_welch(sequences, states, start_p, trans_p, emit_p, tol=1e-4, max_iter=100,
+               processes=None, pseudocount=0.0, checkpoint=None, batch_size=256,
+               log=None):
+  """Train a dict model on sequences of observations with Baum-Welch and
+  return the new start, transition and emission dicts with the list of
+  log likelihoods per iteration. Training stops when the log likelihood
+  improves by less than tol or after max_iter iterations. With checkpoint,
+  the parameters are saved there (in .npz format, under the exact name
+  given) after every iteration, and training resumes from that file if it
+  exists."""
+  symbols, log_start, log_trans, log_emit = model_arrays(states, start_p, trans_p, emit_p)
+  start, trans, emit = numpy.exp(log_start), numpy.exp(log_trans), numpy.exp(log_emit)
+  history = []
+
+  if checkpoint is not None and os.path.exists(checkpoint):
+    saved = numpy.load(checkpoint)
+    start, trans, emit = saved['start'], saved['trans'], saved['emit']
+    history = list(saved['history'])
+
+  index = dict((o, i) for i, o in enumerate(symbols))
+  encoded = [numpy.array([index[o] for o in seq], dtype=numpy.intp) for seq in sequences]
+  encoded = [seq for seq in encoded if len(seq)]
+
+  if processes is None:
+    processes = multiprocessing.cpu_count()
+  processes = max(1, min(processes, len(encoded)))
+  # round-robin over length-sorted sequences gives shards of similar work
+  order = sorted(range(len(encoded)), key=lambda i: len(encoded[i]))
+  shards = [[encoded[i] for i in order[k::processes]] for k in range(processes)]
+
+  pool = None
+  if processes > 1:
+    pool = multiprocessing.Pool(processes, _init_worker, (shards,))
+  try:
+    while len(history) < max_iter:
+      jobs = [(k, start, trans, emit, batch_size) for k in range(len(shards))]
+      if pool is None:
+        _init_worker(shards)
+        results = [_shard_job(job) for job in jobs]
+      else:
+        results = pool.map(_shard_job, jobs)
+      start_counts, trans_counts, emit_counts, loglik, skipped = [sum(r) for r in zip(*results)]
+
+      start = mstep(start_counts, start, pseudocount)
+      trans = mstep(trans_counts, trans, pseudocount)
+      emit = mstep(emit_counts, emit, pseudocount)
+      history.append(loglik)
+      if log is not None:
+        log.write("iteration {0}: log likelihood {1:.6f}, {2} sequences skipped\n".format(
+            len(history), loglik, skipped))
+      if checkpoint is not None:
+        # through a file so that numpy.savez keeps the name as given
+        with open(checkpoint, "wb") as f:
+          numpy.savez(f, start=start, trans=trans, emit=emit, history=numpy.array(history))
+      if len(history) > 1 and abs(history[-1] - history[-2]) < tol:
+        break
+  finally:
+    if pool is not None:
+      pool.close()
+      pool.join()
+
+  start_p = dict((s, float(start[i])) for i, s in enumerate(states))
+  trans_p = dict((s, dict((r, float(trans[i, j])) for j, r in enumerate(states))) for i, s in enumerate(states))
+  emit_p = dict((s, dict((o, float(emit[i, k])) for k, o in enumerate(symbols))) for i, s in enumerate(states))
+  return start_p, trans_p, emit_p, history
+
+
+def read_sequences(filename):
+  """Training sequences from a FASTA file, or one sequence per line."""
+  with open(filename) as f:
+    is_fasta = f.read(1) == ">"
+  if is_fasta:
+    return [seq for name, seq in fasta.readFasta(filename)]
+  with open(filename) as f:
+    return [line.strip() for line in f if line.strip()]
+
+
+def main():
+  if len(sys.argv) < 2:
+    print("Usage: {0} <sequences> [checkpoint.npz]".format(sys.argv[0]))
+    print("    Trains the secondary structure HMM of Viterbi.py on the")
+    print("    sequences (FASTA, or one per line) and prints the new model.")
+    sys.exit(1)
+
+  sequences = read_sequences(sys.argv[1])
+  checkpoint = sys.argv[2] if len(sys.argv) > 2 else None
+  start_p, trans_p, emit_p, history = baum_welch(
+      sequences, states, start_probability, transition_probability, emission_probability,
+      checkpoint=checkpoint, log=sys.stdout)
+
+  print("start_probability = {0}".format(start_p))
+  print("transition_probability = {0}".format(trans_p))
+  print("emission_probability = {0}".format(emit_p))
+
+if __name__ == "__main__":
+  main()
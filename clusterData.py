@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""Loads cluster input files for KMeans and fuzzyKMeans
+
+The input is tab-separated text, one point per line, whose last column is a
+label (the cluster index written by generateClusters) and is dropped. The
+values are parsed a chunk of lines at a time straight into one preallocated
+(N x M) array. With a cache file, the array is written once as .npy and
+memory-mapped on later runs instead of parsing the text again.
+"""
+import os
+import sys
+from itertools import islice
+
+import numpy
+from numpy.lib.format import open_memmap
+
+USAGE = """
+Usage: {0} input_file [cache_file]
+    Parses input_file and writes it to cache_file (default input_file.npy)
+    for fast loading by KMeans.py and fuzzyKMeans.py.
+"""
+
+
+def scan_shape(fname):
+    """Return the number of points and of values per point of a file."""
+    with open(fname) as f:
+        rows = sum(1 for line in f if line.strip())
+    return rows, count_columns(fname)
+
+
+def count_columns(fname):
+    """Return the number of values per point, from the first line of a file."""
+    with open(fname) as f:
+        for line in f:
+            if line.strip():
+                return len(line.rstrip("\r\n").split("\t")) - 1
+    return 0
+
+
+def iter_points(fname, dtype=numpy.float64, chunk_rows=1 << 16, columns=None):
+    """Yield the points of a file as (chunk_rows x M) arrays, in file order.
+
+    Only one chunk is held in memory, so a file can be streamed through
+    mini-batch k-means without loading it.
+    """
+    if columns is None:
+        columns = count_columns(fname)
+    with open(fname) as f:
+        while True:
+            lines = list(islice(f, chunk_rows))
+            if not lines:
+                break
+            lines = [line for line in lines if line.strip()]
+            if lines:
+                yield numpy.loadtxt(lines, delimiter="\t", usecols=range(columns),
+                                    dtype=dtype, ndmin=2)
+
+
+def parse_into(fname, out, chunk_rows=1 << 16):
+    """Parse the points of a file into the preallocated array out."""
+    start = 0
+    for chunk in iter_points(fname, out.dtype, chunk_rows, out.shape[1]):
+        out[start:start + len(chunk)] = chunk
+        start += len(chunk)
+    return out
+
+
+def load_points(fname, dtype=numpy.float64, cache=None, chunk_rows=1 << 16):
+    """Return the points of a file as an (N x M) array.
+
+    With cache (a .npy path), the parsed array is saved there and the file
+    is returned memory-mapped read-only. A cache at least as new as the
+    input is mapped directly, so only the pages used are read.
+    """
+    if cache is not None and os.path.exists(cache) and \
+            os.path.getmtime(cache) >= os.path.getmtime(fname):
+        points = numpy.load(cache, mmap_mode="r")
+        if points.dtype == dtype:
+            return points
+
+    shape = scan_shape(fname)
+    if cache is None:
+        return parse_into(fname, numpy.empty(shape, dtype=dtype), chunk_rows)
+
+    out = open_memmap(cache, mode="w+", dtype=dtype, shape=shape)
+    parse_into(fname, out, chunk_rows)
+    out.flush()
+    del out
+    return numpy.load(cache, mmap_mode="r")
+
+
+def main():
+    if len(sys.argv) not in (2, 3):
+        print(USAGE.format(sys.argv[0]))
+        sys.exit(1)
+
+    fname = sys.argv[1]
+    cache = sys.argv[2] if len(sys.argv) == 3 else fname + ".npy"
+    points = load_points(fname, cache=cache)
+    print("{0}: {1} points x {2} values".format(cache, points.shape[0], points.shape[1]))
+
+if __name__ == "__main__":
+    main()
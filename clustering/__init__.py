@@ -0,0 +1,12 @@
+""" k-means and fuzzy c-means clustering of (N x M) arrays of points, with Euclidean, cosine or Pearson distances.
+
+    from clustering import KMeans
+    model = KMeans(3, init='k-means++', n_init=4).fit(points)
+    model.centers, model.clusters, model.predict(new_points)
+
+KMeans.py and fuzzyKMeans.py are the command line interfaces. Plots are in clustering.plotting, which is the only
+module that uses matplotlib. """
+
+from .kmeans import KMeans, run_Kmeans, assign_clusters, inertia, json_log
+from .fuzzy import FuzzyCMeans, run_fuzzy_cmeans, memberships
+from .metrics import METRICS, get_metric
@@ -0,0 +1,138 @@
+""" fuzzy c-means clustering with a fuzzifier m: the (N x K) membership matrix and the weighted centers are computed
+in blocks of points, for any metric of clustering.metrics. FuzzyCMeans wraps them in a fit/predict interface. """
+
+import time
+import numpy
+
+from . import metrics
+from .kmeans import default_block_size, seed_centers
+
+#randomly initialize the centers, with a numpy Generator (or seed) if given for reproducible runs
+def initialize_clusters(points, k, rng=None):
+	return seed_centers(points,k,'random',rng)
+
+#memberships of a block of points: u[i,k] = 1/sum_j (d_ik/d_ij)^(2/(m-1)), computed as (min_j d_ij^2/d_ik^2)^(1/(m-1))
+#normalized per row, so that nothing overflows. A point lying on centers belongs to them only. With a cosine or
+#pearson metric (see clustering.metrics), its distances take the place of the squared distances d^2.
+def block_memberships(block,mu,m,metric=None,stats=None):
+	distances = metrics.get_metric(metric).distances(block,mu,stats)
+	closest = distances.min(axis=1)[:,None]
+	with numpy.errstate(divide='ignore',invalid='ignore'):
+		u = numpy.where(closest > 0,(closest/distances)**(1.0/(m-1)),distances == 0)
+	u /= u.sum(axis=1)[:,None]
+	return u
+
+#the (N x K) membership matrix of the points for fuzzifier m, computed in blocks of points. Written into out if
+#given, and returned with the largest change of a membership from the values out held before
+def memberships(points,mu,m=2.0,out=None,block_size=None,metric=None,stats=None):
+	mu = numpy.asarray(mu,dtype=float)
+	metric = metrics.get_metric(metric)
+	if block_size is None:
+		block_size = default_block_size(len(mu))
+	change = 0.0 if out is not None else numpy.inf
+	if out is None:
+		out = numpy.empty((len(points),len(mu)))
+	for start in range(0,len(points),block_size):
+		block_stats = None if stats is None else stats[start:start+block_size]
+		u = block_memberships(numpy.asarray(points[start:start+block_size],dtype=float),mu,m,metric,block_stats)
+		if change < numpy.inf:
+			change = max(change,float(numpy.abs(u-out[start:start+block_size]).max()))
+		out[start:start+block_size] = u
+	return out, change
+
+#assign the points to the cluster of their largest membership
+def assign_clusters_fuzzy(points,mu,m=2.0,metric=None):
+	return memberships(points,mu,m,metric=metric)[0].argmax(axis=1)
+
+#calculate the new centroids: the means of all the points weighted by their memberships to the power m, and by the
+#per-point weights of the metric if given
+def redefine_centers(points,u,m=2.0,block_size=None,weights=None):
+	if block_size is None:
+		block_size = default_block_size(u.shape[1])
+	sums = numpy.zeros((u.shape[1],points.shape[1]))
+	totals = numpy.zeros(u.shape[1])
+	for start in range(0,len(points),block_size):
+		w = u[start:start+block_size]**m
+		if weights is not None:
+			w *= weights[start:start+block_size,None]
+		sums += numpy.dot(w.T,numpy.asarray(points[start:start+block_size],dtype=float))
+		totals += w.sum(axis=0)
+	return sums/numpy.maximum(totals,numpy.finfo(float).tiny)[:,None]
+
+#the fuzzy c-means objective: the sum of the distances of the points to every center weighted by memberships^m
+def objective(points,mu,u,m=2.0,metric=None,stats=None,block_size=None):
+	metric = metrics.get_metric(metric)
+	if block_size is None:
+		block_size = default_block_size(len(mu))
+	total = 0.0
+	for start in range(0,len(points),block_size):
+		block = numpy.asarray(points[start:start+block_size],dtype=float)
+		distances = metric.distances(block,mu,None if stats is None else stats[start:start+block_size])
+		total += (u[start:start+block_size]**m*distances).sum()
+	return float(total)
+
+#fuzzy c-means with fuzzifier m > 1 from k random centers (or from the centers mu): alternate memberships and
+#weighted centers until no membership changes by more than tol, or max_iterations. Returns the centers (projected by
+#the metric) and memberships. callback, if given, gets a record of every iteration: its number, the seconds spent
+#computing the memberships and the centers, the objective, the points whose largest membership moved to another
+#cluster, the largest membership change and the norm of the center shifts.
+def run_fuzzy_cmeans(d,k,m=2.0,tol=1e-5,max_iterations=100,mu=None,rng=None,metric='euclidean',callback=None):
+	if m <= 1:
+		raise ValueError('the fuzzifier m must be greater than 1')
+	metric = metrics.get_metric(metric)
+	stats = metric.precompute(d)
+	weights = metric.weights(stats)
+	if mu is None:
+		mu = initialize_clusters(d,k,numpy.random.default_rng(rng))
+	u = memberships(d,mu,m,metric=metric,stats=stats)[0]
+	for current_iteration in range(1,max_iterations+1):
+		started = time.time()
+		new_mu = redefine_centers(d,u,m,weights=weights)
+		updated = time.time()
+		old_clusters = u.argmax(axis=1) if callback is not None else None
+		u, change = memberships(d,new_mu,m,out=u,metric=metric,stats=stats)
+		if callback is not None:
+			callback({'iteration':current_iteration,'assign_seconds':time.time()-updated,'update_seconds':updated-started,
+				'objective':objective(d,new_mu,u,m,metric,stats),'moved':int(numpy.count_nonzero(u.argmax(axis=1) != old_clusters)),
+				'change':change,'shift':float(numpy.sqrt(((metric.project(new_mu)-metric.project(mu))**2).sum()))})
+		mu = new_mu
+		if change < tol:
+			break
+	return metric.project(mu), u
+
+#fuzzy c-means with a fit/predict interface; the parameters are those of run_fuzzy_cmeans. After fit, centers holds
+#the (k x M) centers, memberships the (N x k) memberships of the points fitted and clusters their largest membership.
+class FuzzyCMeans(object):
+
+	def __init__(self,k,m=2.0,tol=1e-5,max_iterations=100,seed=None,metric='euclidean',callback=None):
+		if m <= 1:
+			raise ValueError('the fuzzifier m must be greater than 1')
+		self.k = k
+		self.m = m
+		self.tol = tol
+		self.max_iterations = max_iterations
+		self.seed = seed
+		self.metric = metrics.get_metric(metric)
+		self.callback = callback
+		self.centers = None
+		self.memberships = None
+		self.clusters = None
+
+	def fit(self,points):
+		self.centers, self.memberships = run_fuzzy_cmeans(points,self.k,self.m,self.tol,self.max_iterations,
+			rng=self.seed,metric=self.metric,callback=self.callback)
+		self.clusters = self.memberships.argmax(axis=1)
+		return self
+
+	#the (N x k) memberships of points to the fitted centers
+	def predict_memberships(self,points,block_size=None):
+		if self.centers is None:
+			raise ValueError('the model has not been fitted')
+		return memberships(points,self.centers,self.m,block_size=block_size,metric=self.metric)[0]
+
+	#the cluster of largest membership of every point
+	def predict(self,points,block_size=None):
+		return self.predict_memberships(points,block_size).argmax(axis=1)
+
+	def fit_predict(self,points):
+		return self.fit(points).clusters
@@ -0,0 +1,495 @@
+""" k-means clustering: seeding (random, k-means++, k-means||), Lloyd's iterations with optional Hamerly or Elkan
+bounds, restarts in a process pool and mini-batch k-means, for any metric of clustering.metrics. KMeans wraps them in
+a fit/predict interface. """
+
+import json
+import time
+import random
+import multiprocessing
+import numpy
+
+from . import metrics
+
+#randomly initialize the centers, with a numpy Generator (or seed) if given for reproducible runs
+def initialize_clusters(points, k, rng=None):
+	if rng is None:
+		return points[random.sample(range(len(points)),k)].copy()
+	rows = numpy.sort(numpy.random.default_rng(rng).choice(len(points),k,replace=False))
+	return numpy.array(points[rows],dtype=float)
+
+#k-means++ seeding: each new center is a point drawn with probability proportional to its (weighted) squared
+#distance (or metric distance) to the closest center chosen so far
+def kmeans_plusplus(points,k,rng=None,weights=None,metric=None,stats=None):
+	rng = numpy.random.default_rng(rng)
+	weights = numpy.ones(len(points)) if weights is None else numpy.asarray(weights,dtype=float)
+	mu = numpy.empty((k,points.shape[1]))
+	mu[0] = points[numpy.searchsorted(numpy.cumsum(weights),rng.random()*weights.sum(),side='right')]
+	closest = min_squared_distances(points,mu[:1],metric=metric,stats=stats)
+	for c in range(1,k):
+		cumulative = numpy.cumsum(closest*weights)
+		if cumulative[-1] > 0:
+			row = numpy.searchsorted(cumulative,rng.random()*cumulative[-1],side='right')
+		else: #every point is already a center
+			row = rng.integers(len(points))
+		mu[c] = points[min(row,len(points)-1)]
+		numpy.minimum(closest,min_squared_distances(points,mu[c:c+1],metric=metric,stats=stats),out=closest)
+	return mu
+
+#k-means|| seeding: a few passes each keep every point with probability oversampling*distance/total distance,
+#then the candidates, weighted by the points closest to them, are reduced to k centers with k-means++
+def kmeans_parallel(points,k,rng=None,rounds=5,oversampling=None,metric=None,stats=None):
+	rng = numpy.random.default_rng(rng)
+	if oversampling is None:
+		oversampling = 2*k
+	candidates = [numpy.array(points[rng.integers(len(points))][None,:],dtype=float)]
+	closest = min_squared_distances(points,candidates[0],metric=metric,stats=stats)
+	for r in range(rounds):
+		total = closest.sum()
+		if total <= 0:
+			break
+		rows = numpy.nonzero(rng.random(len(points)) < oversampling*closest/total)[0]
+		if len(rows):
+			candidates.append(numpy.array(points[rows],dtype=float))
+			numpy.minimum(closest,min_squared_distances(points,candidates[-1],metric=metric,stats=stats),out=closest)
+	candidates = numpy.vstack(candidates)
+	if len(candidates) < k:
+		candidates = numpy.vstack((candidates,initialize_clusters(points,k-len(candidates),rng)))
+	weights = numpy.bincount(assign_clusters(points,candidates,metric=metric,stats=stats),minlength=len(candidates))
+	return kmeans_plusplus(candidates,k,rng,weights,metric)
+
+#choose k initial centers with the given method: 'random', 'k-means++' or 'k-means||'
+def seed_centers(points,k,init='random',rng=None,metric=None,stats=None):
+	if init == 'random':
+		return initialize_clusters(points,k,rng)
+	if init == 'k-means++':
+		return kmeans_plusplus(points,k,rng,metric=metric,stats=stats)
+	if init == 'k-means||':
+		return kmeans_parallel(points,k,rng,metric=metric,stats=stats)
+	raise ValueError('unknown initialization: {0}'.format(init))
+
+#squared distances from every point to every center, a (N x K) array; norms are the squared norms of the points if known
+def squared_distances(points,mu,norms=None):
+	return metrics.get_metric('euclidean').distances(points,mu,norms)
+
+#number of points per block of distances, keeping each block around 32 MB
+def default_block_size(k):
+	return max(1,(1 << 22)//max(1,k))
+
+#distances from the points start:start+block_size to every center with a metric (see clustering.metrics), using its
+#precomputed per-point stats if given
+def block_distances(points,mu,start,block_size,metric,stats=None):
+	block = numpy.asarray(points[start:start+block_size],dtype=float)
+	return metric.distances(block,mu,None if stats is None else stats[start:start+block_size])
+
+#assign the points to clusters, by squared Euclidean distance or with the given metric
+def assign_clusters(points,mu,block_size=None,metric=None,stats=None):
+	mu = numpy.asarray(mu,dtype=float)
+	metric = metrics.get_metric(metric)
+	if block_size is None:
+		block_size = default_block_size(len(mu))
+	clusters = numpy.empty(len(points),dtype=numpy.intp)
+	for start in range(0,len(points),block_size):
+		clusters[start:start+block_size] = block_distances(points,mu,start,block_size,metric,stats).argmin(axis=1) #closest center of each point
+	return clusters #in order of the points provided originally
+
+#squared distance (or metric distance) from every point to its closest center
+def min_squared_distances(points,mu,block_size=None,metric=None,stats=None):
+	mu = numpy.asarray(mu,dtype=float)
+	metric = metrics.get_metric(metric)
+	if block_size is None:
+		block_size = default_block_size(len(mu))
+	closest = numpy.empty(len(points))
+	for start in range(0,len(points),block_size):
+		closest[start:start+block_size] = block_distances(points,mu,start,block_size,metric,stats).min(axis=1)
+	return closest
+
+#within-cluster sum of squared distances (or metric distances) of the points assigned to their closest centers, or to
+#the centers of the given clusters
+def inertia(points,mu,metric=None,stats=None,clusters=None):
+	if clusters is None:
+		return float(min_squared_distances(points,mu,metric=metric,stats=stats).sum())
+	metric = metrics.get_metric(metric)
+	mu = metric.project(mu)
+	total = 0.0
+	for start in range(0,len(points),65536):
+		block = numpy.asarray(points[start:start+65536],dtype=float)
+		block_stats = None if stats is None else stats[start:start+65536]
+		total += metric.paired_distances(block,mu[clusters[start:start+65536]],block_stats).sum()
+	return float(total)
+
+#mean variance per dimension of the points in the space of the metric, the scale center shifts are compared to
+def point_spread(points,metric=None):
+	metric = metrics.get_metric(metric)
+	sums = numpy.zeros(points.shape[1])
+	squares = 0.0
+	for start in range(0,len(points),65536):
+		block = metric.project(numpy.asarray(points[start:start+65536],dtype=float))
+		sums += block.sum(axis=0)
+		squares += (block*block).sum()
+	return max(0.0,squares/len(points)-(sums*sums).sum()/len(points)**2)/points.shape[1]
+
+#Lloyd assignment accelerated with the triangle inequality. The assigner keeps, for every point, an upper bound on
+#the distance to its center and lower bounds on the distances to the other centers: one bound for all of them
+#(method 'hamerly', N floats) or one per center (method 'elkan', N x K floats). When the centers move, the bounds
+#are loosened by the distances moved, and only the points whose bounds overlap get their distances to all centers
+#recomputed, with the same argmin as assign_clusters. A small slack keeps rounding from skipping a point that
+#assign_clusters would move, so the clusters are the same as assign_clusters gives.
+class BoundedAssigner(object):
+
+	def __init__(self,points,method='hamerly'):
+		if method not in ('hamerly','elkan'):
+			raise ValueError('unknown bounds: {0}'.format(method))
+		self.method = method
+		self.mu = None
+		self.computed = 0 #point to center distances computed so far
+		self.norms = numpy.empty(len(points)) #squared norms of the points
+		for start in range(0,len(points),65536):
+			block = numpy.asarray(points[start:start+65536],dtype=float)
+			self.norms[start:start+65536] = (block*block).sum(axis=1)
+		self.radius = float(numpy.sqrt(self.norms.max())) if len(points) else 0.0 #scale of the slack
+
+	#distances from some points (all of them if rows is None) to every center: new clusters and exact bounds
+	def recompute(self,points,rows,mu):
+		block_size = default_block_size(len(mu))
+		count = len(points) if rows is None else len(rows)
+		for start in range(0,count,block_size):
+			if rows is None:
+				block_rows = slice(start,min(start+block_size,count))
+			else:
+				block_rows = rows[start:start+block_size]
+			block = numpy.asarray(points[block_rows],dtype=float)
+			distances = squared_distances(block,mu,self.norms[block_rows])
+			clusters = distances.argmin(axis=1)
+			assigned = (numpy.arange(len(block)),clusters)
+			self.clusters[block_rows] = clusters
+			self.upper[block_rows] = numpy.sqrt(distances[assigned])
+			if self.method == 'elkan':
+				self.lower[block_rows] = numpy.sqrt(distances)
+			else:
+				distances[assigned] = numpy.inf #the second closest center is the lower bound
+				self.lower[block_rows] = numpy.sqrt(distances.min(axis=1))
+		self.computed += count*len(mu)
+
+	#distances from some points to their own centers, one matrix-vector product per center
+	def own_distances(self,points,rows,mu):
+		distances = numpy.empty(len(rows))
+		order = numpy.argsort(self.clusters[rows],kind='stable')
+		bounds = numpy.searchsorted(self.clusters[rows[order]],numpy.arange(len(mu)+1))
+		for c in range(len(mu)):
+			for start in range(bounds[c],bounds[c+1],65536):
+				group = order[start:min(start+65536,bounds[c+1])]
+				block = numpy.asarray(points[rows[group]],dtype=float)
+				distances[group] = self.norms[rows[group]]-2*block.dot(mu[c])+mu[c].dot(mu[c])
+		self.computed += len(rows)
+		return numpy.sqrt(numpy.maximum(distances,0))
+
+	def __call__(self,points,mu):
+		mu = numpy.array(mu,dtype=float)
+		if self.mu is None or self.mu.shape != mu.shape:
+			self.clusters = numpy.zeros(len(points),dtype=numpy.intp)
+			self.upper = numpy.zeros(len(points))
+			self.lower = numpy.full((len(points),len(mu)) if self.method == 'elkan' else len(points),numpy.inf)
+			self.recompute(points,None,mu)
+			self.mu = mu
+			return self.clusters.copy()
+
+		#loosen the bounds by how far the centers moved
+		moves = numpy.sqrt(((mu-self.mu)**2).sum(axis=1))
+		self.upper += moves[self.clusters]
+		if self.method == 'elkan':
+			self.lower -= moves
+		elif len(mu) > 1:
+			order = numpy.argsort(moves)
+			farthest = numpy.where(self.clusters == order[-1],moves[order[-2]],moves[order[-1]]) #largest move of another center
+			self.lower -= farthest
+		self.mu = mu
+
+		#half the distance from each center to the others: a point closer than that to its center keeps it
+		half = 0.5*numpy.sqrt(squared_distances(mu,mu))
+		numpy.fill_diagonal(half,numpy.inf)
+		separation = half.min(axis=1)
+		slack = 1e-7*(self.radius+numpy.sqrt((mu*mu).sum(axis=1)).max())
+
+		if self.method == 'elkan':
+			rows = numpy.nonzero(self.upper+slack > separation[self.clusters])[0]
+		else:
+			rows = numpy.nonzero(self.upper+slack > numpy.maximum(separation[self.clusters],self.lower))[0]
+		if len(rows):
+			#tighten the upper bounds of the remaining points and test again
+			self.upper[rows] = self.own_distances(points,rows,mu)
+			upper = self.upper[rows]+slack
+			if self.method == 'elkan':
+				overlap = (upper[:,None] > self.lower[rows]) & (upper[:,None] > half[self.clusters[rows]])
+				overlap[numpy.arange(len(rows)),self.clusters[rows]] = False
+				rows = rows[overlap.any(axis=1)]
+			else:
+				rows = rows[upper > numpy.maximum(separation[self.clusters[rows]],self.lower[rows])]
+			self.recompute(points,rows,mu)
+		return self.clusters.copy()
+
+#calculate the new centroids, the means of the points scaled by weights if given (see clustering.metrics); a cluster that
+#lost all its points keeps its old center. the points are summed block_size rows at a time, so that only one block
+#is ever scaled by the weights
+def redefine_centers(points,clusters,mu,weights=None,block_size=None):
+	mu = numpy.asarray(mu,dtype=float)
+	if block_size is None:
+		block_size = default_block_size(mu.shape[1])
+	sums = numpy.zeros(mu.shape)
+	for start in range(0,len(points),block_size): #sum of the points of every cluster
+		block = numpy.asarray(points[start:start+block_size],dtype=float)
+		if weights is not None:
+			block = block*weights[start:start+block_size,None]
+		numpy.add.at(sums,clusters[start:start+block_size],block)
+	counts = numpy.bincount(clusters,minlength=len(mu))
+	new_mu = mu.copy()
+	filled = counts > 0
+	new_mu[filled] = sums[filled]/counts[filled,None]
+	return new_mu
+
+#test if convergence has been reached after an iteration (see lloyd for the record): at most a fraction churn_tol of
+#the points changed cluster, or the centers moved by a total squared distance of at most tol times the spread of the
+#points, or (with inertia_tol) the inertia fell by at most inertia_tol of its previous value
+def converged(record,n_points,spread,tol=1e-4,inertia_tol=0.0,churn_tol=0.0,old_inertia=None):
+	if record['moved'] <= churn_tol*n_points:
+		return True
+	if record['shift']**2 <= tol*spread:
+		return True
+	if inertia_tol > 0 and old_inertia is not None:
+		return old_inertia-record['inertia'] <= inertia_tol*old_inertia
+	return False
+
+#a callback writing every iteration record as a line of JSON to a stream
+def json_log(stream,**fields):
+	def write(record):
+		record = dict(record,**fields)
+		stream.write(json.dumps(record,sort_keys=True)+'\n')
+		stream.flush()
+	return write
+
+#run Lloyd's iterations from the initial centers with a metric (see clustering.metrics) and its precomputed stats of the
+#points; assign can be a BoundedAssigner for the Euclidean metric. Stops when converged or after max_iterations.
+#callback, if given, gets a record of every iteration: its number (0 for the initial assignment), the seconds spent
+#assigning the points (with the inertia) and updating the centers, the inertia, the number of points that moved to
+#another cluster and the norm of the center shifts. The centers are returned projected by the metric.
+def lloyd(d,initial_mu,max_iterations=300,assign=None,metric=None,stats=None,tol=1e-4,inertia_tol=0.0,churn_tol=0.0,callback=None,spread=None):
+	metric = metrics.get_metric(metric)
+	if stats is None:
+		stats = metric.precompute(d)
+	weights = metric.weights(stats)
+	if assign is None:
+		assign = lambda points,mu: assign_clusters(points,mu,metric=metric,stats=stats)
+	if spread is None:
+		spread = point_spread(d,metric)
+	with_inertia = callback is not None or inertia_tol > 0
+
+	started = time.time()
+	current_mu = numpy.asarray(initial_mu,dtype=float)
+	current_clusters = assign(d,current_mu)
+	current_inertia = inertia(d,current_mu,metric,stats,current_clusters) if with_inertia else None
+	if callback is not None:
+		callback({'iteration':0,'assign_seconds':time.time()-started,'update_seconds':0.0,'inertia':current_inertia,'moved':len(d),'shift':None})
+
+	for current_iteration in range(1,max_iterations+1):
+		started = time.time()
+		new_mu = redefine_centers(d,current_clusters,current_mu,weights)
+		updated = time.time()
+		new_clusters = assign(d,new_mu)
+		new_inertia = inertia(d,new_mu,metric,stats,new_clusters) if with_inertia else None
+		record = {'iteration':current_iteration,'assign_seconds':time.time()-updated,'update_seconds':updated-started,
+			'inertia':new_inertia,'moved':int(numpy.count_nonzero(new_clusters != current_clusters)),
+			'shift':float(numpy.sqrt(((metric.project(new_mu)-metric.project(current_mu))**2).sum()))}
+		if callback is not None:
+			callback(record)
+		done = converged(record,len(d),spread,tol,inertia_tol,churn_tol,current_inertia)
+		current_mu, current_clusters, current_inertia = new_mu, new_clusters, new_inertia
+		if done:
+			break
+	return metric.project(current_mu), current_clusters
+
+#points of the restarts, their metric stats and spread, set once per worker process by the pool initializer
+restart_points = None
+restart_stats = None
+restart_spread = None
+
+def init_restart_worker(points,stats=None,spread=None):
+	global restart_points, restart_stats, restart_spread
+	restart_points = points
+	restart_stats = stats
+	restart_spread = spread
+
+#one restart: seed, run Lloyd's iterations with the options of lloyd and return the centers with their inertia, and
+#the iteration records if logged
+def run_restart(args):
+	k, init, seed, algorithm, metric, options, logged = args
+	rng = numpy.random.default_rng(seed)
+	assign = None if algorithm == 'lloyd' else BoundedAssigner(restart_points,algorithm)
+	history = []
+	mu, clusters = lloyd(restart_points,seed_centers(restart_points,k,init,rng,metric,restart_stats),assign=assign,metric=metric,
+		stats=restart_stats,spread=restart_spread,callback=history.append if logged else None,**options)
+	return mu, inertia(restart_points,mu,metric,restart_stats), history
+
+#run the kmeans algorithm n_init times from independent seeds, in a process pool when n_init > 1, and keep the
+#solution with the lowest inertia. The restarts get distinct seeds spawned from seed, so runs are reproducible.
+#algorithm 'hamerly' or 'elkan' skips distance computations with BoundedAssigner, giving the same result as 'lloyd'.
+#metric 'cosine' or 'pearson' clusters by correlation instead of Euclidean distance (Lloyd's iterations only).
+#tol, inertia_tol and churn_tol set when an iteration has converged (see converged); callback gets the iteration
+#records of every restart (see lloyd), with its index as 'restart'. Returns the centers, clusters and inertia.
+def run_Kmeans(d,k,init='random',n_init=1,seed=None,processes=None,max_iterations=300,algorithm='lloyd',metric='euclidean',
+		tol=1e-4,inertia_tol=0.0,churn_tol=0.0,callback=None):
+	metric = metrics.get_metric(metric)
+	if algorithm != 'lloyd' and metric.name != 'euclidean':
+		raise ValueError('{0} bounds need the euclidean metric'.format(algorithm))
+	stats = metric.precompute(d)
+	spread = point_spread(d,metric)
+	options = {'max_iterations':max_iterations,'tol':tol,'inertia_tol':inertia_tol,'churn_tol':churn_tol}
+	seeds = numpy.random.SeedSequence(seed).spawn(n_init)
+	jobs = [(k,init,s,algorithm,metric,options,callback is not None) for s in seeds]
+	workers = min(n_init,processes or multiprocessing.cpu_count())
+	if workers > 1:
+		pool = multiprocessing.Pool(workers,init_restart_worker,(d,stats,spread))
+		try:
+			results = pool.map(run_restart,jobs)
+		finally:
+			pool.close()
+			pool.join()
+	else:
+		init_restart_worker(d,stats,spread)
+		results = [run_restart(job) for job in jobs]
+	if callback is not None:
+		for restart, result in enumerate(results):
+			for record in result[2]:
+				record['restart'] = restart
+				callback(record)
+
+	current_mu, current_inertia = min(results,key=lambda result: result[1])[:2]
+	current_clusters = assign_clusters(d,current_mu,metric=metric,stats=stats)
+	return current_mu, current_clusters, current_inertia
+
+#draw n_batches random batches of rows from an array; memory-mapped arrays only read the rows drawn
+def sample_batches(points,batch_size,n_batches,rng=None):
+	rng = numpy.random.default_rng(rng)
+	batch_size = min(batch_size,len(points))
+	for i in range(n_batches):
+		rows = numpy.sort(rng.choice(len(points),batch_size,replace=False))
+		yield numpy.asarray(points[rows],dtype=float)
+
+#update the centers with one batch, in place. Each center moves to the mean of every point assigned to it so far,
+#so its learning rate is (points of the batch)/(points seen) and decreases per center. Returns the largest center move.
+def minibatch_step(batch,mu,counts):
+	clusters = assign_clusters(batch,mu)
+	batch_counts = numpy.bincount(clusters,minlength=len(mu))
+	sums = numpy.zeros(mu.shape)
+	numpy.add.at(sums,clusters,batch)
+	counts += batch_counts
+	filled = batch_counts > 0
+	rates = batch_counts[filled]/counts[filled].astype(float)
+	moves = rates[:,None]*(sums[filled]/batch_counts[filled,None] - mu[filled])
+	mu[filled] += moves
+	return float(numpy.sqrt((moves*moves).sum(axis=1)).max()) if filled.any() else 0.0
+
+#run mini-batch k-means over an iterable of batches. mu and counts (points seen per center) resume a previous run;
+#otherwise the centers are seeded from the first batch with init. Stops early when no center moves more than tol.
+def run_minibatch_Kmeans(batches,k,mu=None,counts=None,tol=None,rng=None,init='random'):
+	if mu is not None:
+		mu = numpy.array(mu,dtype=float)
+	for batch in batches:
+		if mu is None:
+			mu = seed_centers(batch,k,init,numpy.random.default_rng(rng))
+		if counts is None:
+			counts = numpy.zeros(k,dtype=numpy.int64)
+		move = minibatch_step(batch,mu,counts)
+		if tol is not None and move <= tol:
+			break
+	return mu, counts
+
+#save centers and per-center counts, so that a mini-batch run can be resumed, with scalar parameters if given (None
+#values are left out). the .npz data is written to fname as given: numpy.savez would append .npz to a name without it,
+#and a later check for fname would miss the file.
+def save_centroids(fname,mu,counts=None,**parameters):
+	if counts is None:
+		counts = numpy.zeros(len(mu),dtype=numpy.int64)
+	parameters = dict((name,value) for name, value in parameters.items() if value is not None)
+	with open(fname,'wb') as f:
+		numpy.savez(f,mu=mu,counts=counts,**parameters)
+
+#load centers and per-center counts saved by save_centroids
+def load_centroids(fname):
+	with numpy.load(fname) as saved:
+		return saved['mu'], saved['counts']
+
+#k-means with a fit/predict interface; the parameters are those of run_Kmeans. After fit, centers holds the (k x M)
+#centers, counts the points of every center, clusters the cluster of every point fitted and inertia their
+#within-cluster sum of distances. partial_fit updates the centers with new points, and save and load keep a model in
+#.npz format under the exact file name given (readable by load_centroids).
+class KMeans(object):
+
+	parameters = ('k','init','n_init','seed','max_iterations','algorithm','tol','inertia_tol','churn_tol')
+
+	def __init__(self,k,init='random',n_init=1,seed=None,processes=None,max_iterations=300,algorithm='lloyd',
+			metric='euclidean',tol=1e-4,inertia_tol=0.0,churn_tol=0.0,callback=None):
+		self.k = k
+		self.init = init
+		self.n_init = n_init
+		self.seed = seed
+		self.processes = processes
+		self.max_iterations = max_iterations
+		self.algorithm = algorithm
+		self.metric = metrics.get_metric(metric)
+		self.tol = tol
+		self.inertia_tol = inertia_tol
+		self.churn_tol = churn_tol
+		self.callback = callback
+		self.centers = None
+		self.counts = None
+		self.clusters = None
+		self.inertia = None
+
+	def fit(self,points):
+		self.centers, self.clusters, self.inertia = run_Kmeans(points,self.k,self.init,self.n_init,self.seed,self.processes,
+			self.max_iterations,self.algorithm,self.metric,self.tol,self.inertia_tol,self.churn_tol,self.callback)
+		self.counts = numpy.bincount(self.clusters,minlength=self.k).astype(numpy.int64)
+		return self
+
+	#update the centers with a batch of new points as in mini-batch k-means: every center moves to the mean of all the
+	#points assigned to it so far, so earlier points are never revisited. A model not fitted is seeded from the batch.
+	def partial_fit(self,points):
+		if self.metric.name != 'euclidean':
+			raise ValueError('partial_fit needs the euclidean metric')
+		points = numpy.asarray(points,dtype=float)
+		if self.centers is None:
+			self.centers = seed_centers(points,self.k,self.init,numpy.random.default_rng(self.seed))
+			self.counts = numpy.zeros(self.k,dtype=numpy.int64)
+		self.centers = numpy.array(self.centers,dtype=float)
+		minibatch_step(points,self.centers,self.counts)
+		self.clusters = None #the points fitted before are not kept
+		self.inertia = None
+		return self
+
+	#the cluster of the closest center to every point, in blocks of block_size points
+	def predict(self,points,block_size=None):
+		if self.centers is None:
+			raise ValueError('the model has not been fitted')
+		return assign_clusters(points,self.centers,block_size,self.metric)
+
+	def fit_predict(self,points):
+		return self.fit(points).clusters
+
+	#save the centers, counts and parameters (but not the clusters of the points fitted)
+	def save(self,fname):
+		if self.centers is None:
+			raise ValueError('the model has not been fitted')
+		parameters = dict((name,getattr(self,name)) for name in self.parameters)
+		save_centroids(fname,self.centers,self.counts,metric=self.metric.name,inertia=self.inertia,**parameters)
+
+	#load a model saved by save, or centers saved by save_centroids
+	@classmethod
+	def load(cls,fname):
+		with numpy.load(fname) as saved:
+			parameters = dict((name,saved[name].item()) for name in cls.parameters+('metric',) if name in saved.files)
+			parameters.setdefault('k',len(saved['mu']))
+			model = cls(**parameters)
+			model.centers = numpy.array(saved['mu'],dtype=float)
+			model.counts = numpy.array(saved['counts'],dtype=numpy.int64)
+			if 'inertia' in saved.files:
+				model.inertia = saved['inertia'].item()
+		return model
@@ -0,0 +1,114 @@
+""" distance metrics for clustering.kmeans and clustering.fuzzy. A metric computes the (N x K) distances from a block
+of points to the centers as one matrix product. The quantities it needs per point (squared norms, or the norms of the
+rows centered on their means) are computed once with precompute() and passed back in as stats, so iterations never
+touch a point more than once per matrix product. Centers are compared in the space of the metric: project() maps
+them there (for cosine and Pearson, to unit vectors, the latter centered), and the center of a cluster is the mean of
+its points scaled by weights(stats), i.e. the mean of the normalized rows.
+
+    euclidean  squared Euclidean distance ||x - c||^2
+    cosine     1 - cos(x, c)
+    pearson    1 - r(x, c), the Pearson correlation across the values of x and c (for gene expression, across
+               conditions) """
+
+import numpy
+
+BLOCK_ROWS = 1 << 16
+
+#squared Euclidean distance; stats are the squared norms of the points
+class Euclidean(object):
+
+	name = 'euclidean'
+
+	def precompute(self,points,block_rows=BLOCK_ROWS):
+		stats = numpy.empty(len(points))
+		for start in range(0,len(points),block_rows):
+			block = numpy.asarray(points[start:start+block_rows],dtype=float)
+			stats[start:start+block_rows] = (block*block).sum(axis=1)
+		return stats
+
+	def project(self,mu):
+		return numpy.asarray(mu,dtype=float)
+
+	#per-point weights of the center sums, None for plain means
+	def weights(self,stats):
+		return None
+
+	def distances(self,block,mu,stats=None):
+		block = numpy.asarray(block,dtype=float)
+		mu = self.project(mu)
+		if stats is None:
+			stats = (block*block).sum(axis=1)
+		distances = numpy.dot(block,mu.T)
+		distances *= -2
+		distances += stats[:,None]
+		distances += (mu*mu).sum(axis=1)
+		return numpy.maximum(distances,0,out=distances)
+
+	#distance from each point to the projected center in the same row
+	def paired_distances(self,block,centers,stats=None):
+		block = numpy.asarray(block,dtype=float)
+		if stats is None:
+			stats = (block*block).sum(axis=1)
+		distances = stats - 2*(block*centers).sum(axis=1) + (centers*centers).sum(axis=1)
+		return numpy.maximum(distances,0,out=distances)
+
+#cosine distance; stats are the norms of the points. As the centers are unit vectors, the distances only need x.c
+#divided by the norm of x. Points of norm zero are at distance 1 from every center.
+class Cosine(object):
+
+	name = 'cosine'
+
+	def _centered(self,rows):
+		return rows
+
+	def precompute(self,points,block_rows=BLOCK_ROWS):
+		stats = numpy.empty(len(points))
+		for start in range(0,len(points),block_rows):
+			block = self._centered(numpy.asarray(points[start:start+block_rows],dtype=float))
+			stats[start:start+block_rows] = numpy.sqrt((block*block).sum(axis=1))
+		return stats
+
+	def project(self,mu):
+		mu = self._centered(numpy.array(mu,dtype=float,ndmin=2))
+		norms = numpy.sqrt((mu*mu).sum(axis=1))
+		return mu/numpy.where(norms > 0,norms,1)[:,None]
+
+	def weights(self,stats):
+		return numpy.where(stats > 0,1/numpy.where(stats > 0,stats,1),0)
+
+	def distances(self,block,mu,stats=None):
+		block = numpy.asarray(block,dtype=float)
+		if stats is None:
+			stats = self.precompute(block)
+		similarity = numpy.dot(block,self.project(mu).T)
+		similarity /= numpy.where(stats > 0,stats,numpy.inf)[:,None]
+		distances = numpy.subtract(1,similarity,out=similarity)
+		return numpy.maximum(distances,0,out=distances)
+
+	def paired_distances(self,block,centers,stats=None):
+		block = numpy.asarray(block,dtype=float)
+		if stats is None:
+			stats = self.precompute(block)
+		similarity = (block*centers).sum(axis=1)/numpy.where(stats > 0,stats,numpy.inf)
+		return numpy.maximum(1 - similarity,0)
+
+#Pearson correlation distance: the cosine distance of the rows centered on their means. The projected centers sum to
+#zero, so x.c equals the centered product and the points themselves are never centered.
+class Pearson(Cosine):
+
+	name = 'pearson'
+
+	def _centered(self,rows):
+		return rows - rows.mean(axis=1)[:,None]
+
+METRICS = dict((metric.name,metric) for metric in (Euclidean(),Cosine(),Pearson()))
+
+#return the metric of a name, or metric itself (euclidean if None)
+def get_metric(metric=None):
+	if metric is None:
+		return METRICS['euclidean']
+	if isinstance(metric,str):
+		if metric not in METRICS:
+			raise ValueError('unknown metric: {0}'.format(metric))
+		return METRICS[metric]
+	return metric
@@ -0,0 +1,41 @@
+""" plots of clustered 2D points and of the cluster sizes. matplotlib is imported only when a plot is drawn, so the
+clustering modules can be used without it. """
+
+import numpy
+
+COLORS = ['red','blue','green','yellow','cyan','magenta','black']
+
+#sort the points into their assigned clusters
+def sort_by_clusters(points,clusters,k):
+	return [points[numpy.asarray(clusters) == i] for i in range(k)]
+
+#plot if input data is 2D: the points of every cluster and its center as a star. reference, the original cluster of
+#every point if known, is drawn underneath as larger circles.
+def plot(points,mu,clusters,reference=None):
+	k = len(mu)
+	if points.shape[1] == 2 and k <= len(COLORS):
+		import matplotlib.pyplot as plt
+		print('plotting...')
+		if reference is not None:
+			reference = numpy.asarray(reference)
+			for label in numpy.unique(reference):
+				cluster = points[reference == label]
+				plt.scatter(cluster[:,0],cluster[:,1],color=COLORS[int(label) % len(COLORS)],marker = 'o',s=50)
+
+		for current_cluster_index, cluster in enumerate(sort_by_clusters(points,clusters,k)):
+			plt.scatter(cluster[:,0],cluster[:,1],color=COLORS[current_cluster_index])
+			plt.scatter(mu[current_cluster_index][0],mu[current_cluster_index][1],color = COLORS[current_cluster_index],marker = '*',s=200)
+		plt.show()
+	elif points.shape[1] == 2:
+		print('plot only available for {0} clusters or fewer.'.format(len(COLORS)))
+	else:
+		print('plot only available for 2 dimensions.')
+
+#make histogram for large values of K
+def histogram(clusters,k):
+	import matplotlib.pyplot as plt
+	print('plotting histogram...')
+	plt.bar(numpy.arange(k),numpy.bincount(clusters,minlength=k))
+	plt.xlabel('Cluster Number')
+	plt.ylabel('Number of points in cluster')
+	plt.show()
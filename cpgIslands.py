@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+
+""" CpG island finder. The M1 (island) and M2 (background) Markov chains of
+CpGMarkov are joined into the 8-state HMM of Durbin p.52 (A+, C+, G+, T+,
+A-, C-, G-, T-), and its Viterbi path is computed in log space over FASTA
+files of any length, chunk by chunk. Runs of + states are written as BED
+intervals. """
+
+import sys
+import argparse
+
+import numpy
+
+import fasta
+import packedSeq
+from CpGMarkov import M1_transition_probability, M2_transition_probability
+from Viterbi import model_arrays
+
+ISLAND, BACKGROUND = 0, 1
+
+
+def islandModel(leave_island=1e-3, enter_island=1e-5):
+    """
+    Return states, start, transition and emission dicts of the 8-state CpG
+    island HMM, in the form used by Viterbi.py. Inside a model the next base
+    follows that model's chain; an island is left with probability
+    leave_island and entered with probability enter_island at every base,
+    so islands are 1/leave_island bases long on average.
+    """
+    bases = packedSeq.BASES
+    states = tuple(b + "+" for b in bases) + tuple(b + "-" for b in bases)
+    chains = {"+": M1_transition_probability, "-": M2_transition_probability}
+    switch = {("+", "+"): 1 - leave_island, ("+", "-"): leave_island,
+              ("-", "+"): enter_island, ("-", "-"): 1 - enter_island}
+    island = enter_island / (enter_island + leave_island)  # stationary
+
+    start_p = {}
+    trans_p = {}
+    emit_p = {}
+    for x in states:
+        start_p[x] = (island if x[1] == "+" else 1 - island) / 4
+        trans_p[x] = dict((y, switch[x[1], y[1]] * chains[y[1]][x[0]][y[0]]) for y in states)
+        emit_p[x] = {x[0]: 1.0}
+    return states, start_p, trans_p, emit_p
+
+
+def dinucleotideWeights(leave_island=1e-3, enter_island=1e-5):
+    """
+    Collapse the HMM to the two states (island, background) that can emit
+    an observed base. Returns the log start probabilities (5 x 2, by the
+    code of the first base) and the log transition weights (5 x 5 x 2 x 2,
+    by the codes of the previous and current base). Code N (4) carries no
+    information: only the switch probabilities apply across it.
+    """
+    states, start_p, trans_p, emit_p = islandModel(leave_island, enter_island)
+    symbols, log_start, log_trans, log_emit = model_arrays(states, start_p, trans_p, emit_p,
+                                                           symbols=tuple(packedSeq.BASES))
+    island = enter_island / (enter_island + leave_island)
+    with numpy.errstate(divide="ignore"):
+        log_switch = numpy.log([[1 - leave_island, leave_island],
+                                [enter_island, 1 - enter_island]])
+        start = numpy.empty((5, 2))
+        start[4] = numpy.log([island, 1 - island])
+    W = numpy.empty((5, 5, 2, 2))
+    W[:] = log_switch
+    for x in range(4):
+        start[x] = log_start[[x, x + 4]]
+        for y in range(4):
+            W[x, y] = log_trans[numpy.ix_([x, x + 4], [y, y + 4])]
+    return start, W
+
+
+def _maxplus(A, B):
+    # max-plus product of stacks of 2 x 2 matrices
+    return numpy.maximum(A[:, :, 0, None] + B[:, None, 0, :],
+                         A[:, :, 1, None] + B[:, None, 1, :])
+
+
+def _viterbiChunk(v, W):
+    """
+    Viterbi over one chunk of the sequence: v holds the scores of the two
+    states before the chunk and W the n x 2 x 2 transition weights into each
+    position. The recursion V[t] = V[t-1] (x) W[t] is a max-plus product, so
+    it is computed with a parallel prefix scan over W in log2(n) vectorized
+    passes instead of a loop over positions. Returns the scores at every
+    position and the backpointers (n x 2, state at t -> state at t-1).
+    """
+    P = W.copy()
+    d = 1
+    while d < len(P):
+        P[d:] = _maxplus(P[:-d], P[d:])
+        d *= 2
+    V = numpy.maximum(v[0] + P[:, 0], v[1] + P[:, 1])
+    prev = numpy.vstack((v, V[:-1]))
+    back = (prev[:, 1, None] + W[:, 1] > prev[:, 0, None] + W[:, 0]).astype(numpy.int8)
+    return V, back
+
+
+def _traceMaps(back):
+    """
+    For backpointers back[0..m-1], return F (m x 2) with F[k, e] the state
+    at position k on the path that ends in state e at position m-1. Maps
+    are composed from the end with the same doubling scan as _viterbiChunk.
+    """
+    F = numpy.empty((len(back), 2), dtype=numpy.int8)
+    if len(back) == 0:
+        return F
+    G = back[1:].copy()
+    d = 1
+    while d < len(G):
+        G[:-d] = numpy.take_along_axis(G[:-d], G[d:].astype(numpy.intp), axis=1)
+        d *= 2
+    F[:-1] = G
+    F[-1] = (ISLAND, BACKGROUND)
+    return F
+
+
+class _IslandCaller(object):
+    """
+    Viterbi decoding of one record, fed chunk by chunk. Positions are
+    committed as soon as the paths ending in both states agree on them, so
+    only the short undecided tail is kept between chunks; if it grows
+    beyond max_pending it is committed along the best current path.
+    """
+
+    def __init__(self, name, start, W, min_length, max_pending):
+        self.name = name
+        self.start = start
+        self.W = W
+        self.min_length = min_length
+        self.max_pending = max_pending
+        self.v = None
+        self.last = None
+        self.offset = 0  # position of the first pending backpointer
+        self.pending = numpy.zeros((0, 2), dtype=numpy.int8)
+        self.island = None  # start of the open island
+        self.islands = []
+
+    def feed(self, codes):
+        if len(codes) == 0:
+            return []
+        if self.v is None:
+            self.v = self.start[codes[0]]
+            self.last = codes[0]
+            self.pending = numpy.zeros((1, 2), dtype=numpy.int8)
+            codes = codes[1:]
+        if len(codes):
+            prev = numpy.concatenate(([self.last], codes[:-1]))
+            V, back = _viterbiChunk(self.v, self.W[prev, codes])
+            self.v = V[-1] - V[-1].max()
+            self.last = codes[-1]
+            self.pending = numpy.concatenate((self.pending, back))
+
+        F = _traceMaps(self.pending)
+        decided = int(numpy.count_nonzero(F[:, 0] == F[:, 1]))
+        if len(F) - decided > self.max_pending:
+            decided = len(F)
+        self._commit(F[:decided, int(numpy.argmax(self.v))])
+        return self._flush()
+
+    def finish(self):
+        F = _traceMaps(self.pending)
+        self._commit(F[:, int(numpy.argmax(self.v))] if len(F) else F[:, 0])
+        if self.island is not None:
+            self._close(self.offset)
+        return self._flush()
+
+    def _commit(self, path):
+        # record the island runs of the decided path and drop it
+        if len(path):
+            inside = path == ISLAND
+            edges = numpy.diff(numpy.concatenate(([self.island is not None], inside, [False])).astype(numpy.int8))
+            for pos in numpy.nonzero(edges)[0]:
+                if edges[pos] == 1:
+                    self.island = self.offset + pos
+                elif pos < len(path):
+                    self._close(self.offset + pos)
+        self.offset += len(path)
+        self.pending = self.pending[len(path):]
+
+    def _close(self, end):
+        if end - self.island >= self.min_length:
+            self.islands.append((self.name, int(self.island), int(end)))
+        self.island = None
+
+    def _flush(self):
+        islands, self.islands = self.islands, []
+        return islands
+
+
+def findIslands(filename, leave_island=1e-3, enter_island=1e-5, min_length=0,
+                chunk_size=1 << 18, max_pending=1 << 20):
+    """
+    Yield (name, start, end) for each CpG island of the records of a FASTA
+    file (0-based, end exclusive), in file order. The file is read in chunks
+    of chunk_size bases, so memory does not grow with the record length.
+    """
+    start, W = dinucleotideWeights(leave_island, enter_island)
+    caller = None
+    for name, pos, chunk in fasta.streamFasta(filename, chunk_size):
+        if caller is None or name != caller.name or pos == 0:
+            if caller is not None:
+                for island in caller.finish():
+                    yield island
+            caller = _IslandCaller(name, start, W, min_length, max_pending)
+        for island in caller.feed(packedSeq.encode(chunk)):
+            yield island
+    if caller is not None:
+        for island in caller.finish():
+            yield island
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("fasta", nargs="+", help="FASTA files to scan")
+    parser.add_argument("-o", "--output", help="BED file to write (default stdout)")
+    parser.add_argument("--leave-island", type=float, default=1e-3,
+                        help="probability of leaving an island at each base (default 1e-3)")
+    parser.add_argument("--enter-island", type=float, default=1e-5,
+                        help="probability of entering an island at each base (default 1e-5)")
+    parser.add_argument("--min-length", type=int, default=0,
+                        help="shortest island to report (default 0)")
+    parser.add_argument("--chunk-size", type=int, default=1 << 18,
+                        help="bases decoded at a time (default 262144)")
+    args = parser.parse_args()
+
+    out = open(args.output, "w") if args.output else sys.stdout
+    try:
+        for filename in args.fasta:
+            for name, start, end in findIslands(filename, args.leave_island, args.enter_island,
+                                                args.min_length, args.chunk_size):
+                out.write("{0}\t{1}\t{2}\n".format(name, start, end))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+""" Sliding-window CpG log-odds track. Every window of W bases along a
+sequence is scored with log2 P(window | M1) / P(window | M2) for the Markov
+chains of CpGMarkov (Durbin p.50), in bits, and the scores are written as
+a bedGraph track. The score of a window is the sum of the log ratios of its
+W-1 dinucleotides, so all windows come from one cumulative sum: moving the
+window adds the entering dinucleotide and drops the leaving one. """
+
+import sys
+import argparse
+
+import numpy
+
+import fasta
+import packedSeq
+from CpGMarkov import M1_transition_probability, M2_transition_probability
+
+
+def logRatios(model1=M1_transition_probability, model2=M2_transition_probability):
+    """
+    Return the 25 log2 ratios of two transition tables indexed by
+    5*code(x) + code(y) for the dinucleotide xy (codes of packedSeq; 0 for
+    dinucleotides with N).
+    """
+    ratios = numpy.zeros((5, 5))
+    for i, x in enumerate(packedSeq.BASES):
+        for j, y in enumerate(packedSeq.BASES):
+            ratios[i, j] = numpy.log2(model1[x][y] / model2[x][y])
+    return ratios.ravel()
+
+
+def windowScores(codes, window, step=1, ratios=None):
+    """
+    Log-odds of the windows of window bases starting at 0, step, 2*step...
+    of an array of base codes. Returns the window starts and scores; windows
+    containing an N are left out.
+    """
+    if ratios is None:
+        ratios = logRatios()
+    codes = numpy.asarray(codes)
+    if len(codes) < window:
+        return numpy.zeros(0, dtype=numpy.intp), numpy.zeros(0)
+    dinucleotides = codes[:-1].astype(numpy.intp) * 5 + codes[1:]
+    sums = numpy.concatenate(([0.0], numpy.cumsum(ratios[dinucleotides])))
+    starts = numpy.arange(0, len(codes) - window + 1, step)
+    scores = sums[starts + window - 1] - sums[starts]
+
+    nbases = numpy.concatenate(([0], numpy.cumsum(codes == packedSeq.N)))
+    clean = nbases[starts + window] == nbases[starts]
+    return starts[clean], scores[clean]
+
+
+def scanWindows(filename, window, step=1, chunk_size=1 << 20):
+    """
+    Yield (name, starts, scores) arrays for the windows of each record of a
+    FASTA file, chunk by chunk. The last window-1 bases of a chunk are kept
+    for the next one, so windows across chunk boundaries are scored and
+    memory is bounded by the chunk size.
+    """
+    ratios = logRatios()
+    name = None
+    carry = numpy.zeros(0, dtype=numpy.uint8)
+    offset = 0  # record position of carry[0]
+    for record, start, chunk in fasta.streamFasta(filename, chunk_size):
+        if record != name or start == 0:
+            name = record
+            carry = numpy.zeros(0, dtype=numpy.uint8)
+            offset = 0
+        codes = numpy.concatenate((carry, packedSeq.encode(chunk)))
+        # keep the window starts on the step grid of the record
+        first = -offset % step
+        starts, scores = windowScores(codes[first:], window, step, ratios)
+        if len(starts):
+            yield name, starts + offset + first, scores
+        # drop the bases before the first window start not yet scored
+        scored = -(-max(0, len(codes) - first - window + 1) // step)
+        done = min(first + scored * step, len(codes))
+        carry = codes[done:]
+        offset += done
+
+
+def writeBedGraph(out, name, starts, scores, window, step):
+    """
+    Write window scores as bedGraph lines. Each window is reported on its
+    central step bases, so the intervals of a track do not overlap.
+    """
+    shift = (window - min(step, window)) // 2
+    span = min(step, window)
+    lines = ["{0}\t{1}\t{2}\t{3:.4f}\n".format(name, s, s + span, v)
+             for s, v in zip((starts + shift).tolist(), scores.tolist())]
+    out.write("".join(lines))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("fasta", nargs="+", help="FASTA files to score")
+    parser.add_argument("-o", "--output", help="bedGraph file to write (default stdout)")
+    parser.add_argument("-w", "--window", type=int, default=200,
+                        help="window size in bases (default 200)")
+    parser.add_argument("-s", "--step", type=int, default=1,
+                        help="distance between window starts (default 1)")
+    parser.add_argument("--chunk-size", type=int, default=1 << 20,
+                        help="bases read at a time (default 1048576)")
+    args = parser.parse_args()
+    if args.window < 2 or args.step < 1:
+        parser.error("the window must be at least 2 bases and the step at least 1")
+
+    out = open(args.output, "w") if args.output else sys.stdout
+    try:
+        out.write('track type=bedGraph name="CpG log-odds" '
+                  'description="M1/M2 log2 odds, {0} bp windows"\n'.format(args.window))
+        for filename in args.fasta:
+            for name, starts, scores in scanWindows(filename, args.window, args.step,
+                                                    args.chunk_size):
+                writeBedGraph(out, name, starts, scores, args.window, args.step)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+
+""" Streaming and indexed access to FASTA files. Records are read one at a
+time, and a samtools-style .fai index gives random access to regions such as
+chr7:26703024-27706250 through a memory map, so only the bytes of the region
+are read. """
+
+import os
+import sys
+import mmap
+from collections import namedtuple
+
+# One line of a .fai index: sequence name and length, byte offset of the
+# first base, bases per line and bytes per line (including the newline)
+FaiEntry = namedtuple("FaiEntry", "name length offset linebases linewidth")
+
+
+def recordName(header):
+    """Return the name of a record: the first word of its header line."""
+    fields = header[1:].split(None, 1)
+    return fields[0] if fields else ""
+
+
+def readFasta(filename):
+    """Yield (name, sequence) for each record of a FASTA file, one at a time."""
+    name = None
+    seq = []
+
+    with open(filename, "r") as f:
+        for line in f:
+            if line.startswith(">"):
+                if name is not None:
+                    yield name, "".join(seq)
+                name = recordName(line)
+                seq = []
+            else:
+                if name is None:
+                    name = ""  # sequence without a header line
+                seq.append(line.rstrip().upper())
+
+    if name is not None:
+        yield name, "".join(seq)
+
+
+def streamFasta(filename, chunk_size=1 << 20, max_records=None):
+    """
+    Yield (name, start, chunk) for each record of a FASTA file, cutting the
+    sequence into chunks of chunk_size bases (the last one may be shorter).
+    start is the 0-based position of the chunk in its record. Memory stays
+    bounded by chunk_size however long the records are. With max_records,
+    only the first max_records records are read, empty ones included.
+    """
+    name = None
+    start = 0
+    buf = []
+    buflen = 0
+    records = 0
+
+    with open(filename, "r") as f:
+        for line in f:
+            if line.startswith(">"):
+                if buflen > 0:
+                    yield name, start, "".join(buf)
+                records += 1
+                if max_records is not None and records > max_records:
+                    return
+                name = recordName(line)
+                start = 0
+                buf = []
+                buflen = 0
+                continue
+            if name is None:
+                name = ""  # sequence without a header line
+                records += 1
+            line = line.rstrip().upper()
+            buf.append(line)
+            buflen += len(line)
+            if buflen >= chunk_size:
+                joined = "".join(buf)
+                while len(joined) >= chunk_size:
+                    yield name, start, joined[:chunk_size]
+                    start += chunk_size
+                    joined = joined[chunk_size:]
+                buf = [joined]
+                buflen = len(joined)
+
+    if buflen > 0:
+        yield name, start, "".join(buf)
+
+
+def buildIndex(filename, fai=None):
+    """
+    Scan a FASTA file and write its .fai index (to filename + ".fai" unless
+    fai is given). All lines of a record but the last must have the same
+    length. Returns the list of FaiEntry.
+    """
+    entries = []
+    name = None
+
+    def finish():
+        if name is not None:
+            entries.append(FaiEntry(name, length, seqstart, linebases or 0, linewidth or 0))
+
+    with open(filename, "rb") as f:
+        offset = 0
+        for line in iter(f.readline, b""):
+            width = len(line)
+            if line.startswith(b">"):
+                finish()
+                name = recordName(line.decode("ascii"))
+                seqstart = offset + width
+                length = 0
+                linebases = linewidth = None
+                short = False  # seen a line shorter than the first one
+            else:
+                bases = len(line.rstrip(b"\r\n"))
+                if name is None:
+                    raise ValueError("{0}: sequence before the first header".format(filename))
+                if bases == 0:
+                    short = linebases is not None
+                else:
+                    if short or (linebases is not None and bases > linebases):
+                        raise ValueError("{0}: record {1} has lines of different "
+                                         "lengths, cannot index it".format(filename, name))
+                    if linebases is None:
+                        linebases, linewidth = bases, width
+                    elif bases < linebases or width != linewidth:
+                        short = True
+                    length += bases
+            offset += width
+        finish()
+
+    with open(fai or filename + ".fai", "w") as f:
+        for e in entries:
+            f.write("{0}\t{1}\t{2}\t{3}\t{4}\n".format(*e))
+    return entries
+
+
+def loadIndex(filename):
+    """
+    Return the .fai index of a FASTA file as a list of FaiEntry, building
+    it first if it is missing or older than the file.
+    """
+    fai = filename + ".fai"
+    if not os.path.exists(fai) or os.path.getmtime(fai) < os.path.getmtime(filename):
+        return buildIndex(filename, fai)
+
+    entries = []
+    with open(fai, "r") as f:
+        for line in f:
+            name, length, offset, linebases, linewidth = line.split("\t")[:5]
+            entries.append(FaiEntry(name, int(length), int(offset),
+                                    int(linebases), int(linewidth)))
+    return entries
+
+
+def parseRegion(region):
+    """
+    Split a samtools-style region "name:start-end" (1-based, inclusive) into
+    name and 0-based, end-exclusive start and end. start and end are None
+    when the region is just a name.
+    """
+    name, sep, span = region.rpartition(":")
+    if not sep:
+        return region, None, None
+    span = span.replace(",", "")
+    if "-" in span:
+        start, end = span.split("-", 1)
+        return name, int(start) - 1, int(end)
+    return name, int(span) - 1, None
+
+
+class FastaFile(object):
+    """
+    Random access to the records of an indexed FASTA file. The file is
+    memory-mapped, so fetching a region only reads the pages it covers.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        entries = loadIndex(filename)
+        self.index = dict((e.name, e) for e in entries)
+        self.names = [e.name for e in entries]
+        self._file = open(filename, "rb")
+        if os.path.getsize(filename) > 0:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._map = b""
+
+    def length(self, name):
+        return self.index[name].length
+
+    def _byte(self, e, pos):
+        return e.offset + (pos // e.linebases) * e.linewidth + pos % e.linebases
+
+    def fetch(self, name, start=None, end=None):
+        """Return bases start to end (0-based, end exclusive) of record name."""
+        e = self.index[name]
+        start = 0 if start is None else max(0, start)
+        end = e.length if end is None else min(end, e.length)
+        if start >= end:
+            return ""
+        raw = self._map[self._byte(e, start):self._byte(e, end - 1) + 1]
+        return raw.translate(None, b"\r\n").decode("ascii").upper()
+
+    def region(self, region):
+        """Return the bases of a samtools-style region such as chr7:1000-2000."""
+        return self.fetch(*parseRegion(region))
+
+    def close(self):
+        if not isinstance(self._map, bytes):
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: {0} <FASTA> [region ...]".format(sys.argv[0]))
+        print("    Builds the .fai index of the file if needed and prints the")
+        print("    requested regions (name or name:start-end, 1-based).")
+        sys.exit(1)
+
+    with FastaFile(sys.argv[1]) as fa:
+        for region in sys.argv[2:]:
+            seq = fa.region(region)
+            print(">" + region)
+            for i in range(0, len(seq), 60):
+                print(seq[i:i+60])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+
+""" k-th order Markov models of DNA trained from FASTA files, generalising
+the first-order M1/M2 chains of CpGMarkov. Every (k+1)-mer is a 2(k+1)-bit
+integer (packedSeq codes rolled in 2 bits at a time): the high 2k bits are
+the context and the low 2 bits the next base, so training is one bincount
+per chunk and scoring one gather from the table of log probabilities. """
+
+import sys
+import argparse
+
+import numpy
+
+import fasta
+import packedSeq
+
+MAX_ORDER = 12  # 4^13 counts, 512 MB of int64
+
+
+class MarkovModel(object):
+    """
+    A k-th order Markov chain over A, G, C, T. counts[c, b] is the number of
+    times base b followed the k-mer context c; transition probabilities add
+    pseudocount to every count.
+    """
+
+    def __init__(self, order, counts=None, pseudocount=1.0):
+        if not 0 <= order <= MAX_ORDER:
+            raise ValueError("order must be between 0 and {0}".format(MAX_ORDER))
+        self.order = order
+        self.pseudocount = pseudocount
+        if counts is None:
+            counts = numpy.zeros((4 ** order, 4), dtype=numpy.int64)
+        self.counts = numpy.asarray(counts, dtype=numpy.int64).reshape(4 ** order, 4)
+        self._log_probs = None
+
+    def addCounts(self, codes):
+        """Count the (k+1)-mers of an array of base codes."""
+        index = packedSeq.kmerCodes(codes, self.order + 1)
+        index = index[index >= 0]
+        self.counts += numpy.bincount(index, minlength=self.counts.size).reshape(self.counts.shape)
+        self._log_probs = None
+
+    def train(self, filename, chunk_size=1 << 20):
+        """Add the counts of every record of a FASTA file, in one pass."""
+        for codes in _chunks(filename, self.order, chunk_size):
+            self.addCounts(codes)
+        return self
+
+    def probabilities(self):
+        """Transition probabilities, 4^k x 4."""
+        counts = self.counts + self.pseudocount
+        totals = counts.sum(axis=1, keepdims=True)
+        with numpy.errstate(invalid="ignore"):
+            return numpy.where(totals > 0, counts / numpy.maximum(totals, 1e-300), 0.25)
+
+    def logProbabilities(self):
+        """log2 transition probabilities, flattened to be indexed by (k+1)-mer."""
+        if self._log_probs is None:
+            with numpy.errstate(divide="ignore"):
+                self._log_probs = numpy.log2(self.probabilities()).ravel()
+        return self._log_probs
+
+    def positionScores(self, codes):
+        """
+        log2 P(base | previous k bases) for every position of an array of
+        codes that has k bases of context before it (NaN where the
+        (k+1)-mer contains an N).
+        """
+        index = packedSeq.kmerCodes(codes, self.order + 1)
+        scores = self.logProbabilities()[numpy.maximum(index, 0)]
+        scores[index < 0] = numpy.nan
+        return scores
+
+    def score(self, seq):
+        """
+        Return the log2 probability of a sequence (string, PackedSeq or
+        codes) given its first k bases, and the number of positions scored.
+        (k+1)-mers with an N are skipped.
+        """
+        scores = self.positionScores(_codes(seq))
+        scored = ~numpy.isnan(scores)
+        return float(scores[scored].sum()), int(scored.sum())
+
+    def save(self, filename):
+        """
+        Save the model as a compressed .npz file; the counts are stored in
+        the smallest unsigned integer type that holds them.
+        """
+        top = int(self.counts.max()) if self.counts.size else 0
+        dtype = next(t for t in (numpy.uint8, numpy.uint16, numpy.uint32, numpy.uint64)
+                     if top <= numpy.iinfo(t).max)
+        numpy.savez_compressed(filename, order=self.order, pseudocount=self.pseudocount,
+                               counts=self.counts.astype(dtype))
+
+    @classmethod
+    def load(cls, filename):
+        with numpy.load(filename) as data:
+            return cls(int(data["order"]), data["counts"], float(data["pseudocount"]))
+
+
+def _codes(seq):
+    if isinstance(seq, packedSeq.PackedSeq):
+        return seq.codes()
+    if isinstance(seq, str):
+        return packedSeq.encode(seq)
+    return numpy.asarray(seq)
+
+
+def _chunks(filename, order, chunk_size=1 << 20):
+    # Base codes of a FASTA file in chunks; each chunk starts with the last
+    # order bases of the previous chunk of the same record, so every
+    # (k+1)-mer is seen exactly once
+    carry = numpy.zeros(0, dtype=numpy.uint8)
+    for name, start, chunk in fasta.streamFasta(filename, chunk_size):
+        if start == 0:
+            carry = numpy.zeros(0, dtype=numpy.uint8)
+        codes = numpy.concatenate((carry, packedSeq.encode(chunk)))
+        yield codes
+        carry = codes[max(0, len(codes) - order):] if order else codes[:0]
+
+
+def scoreRecords(filename, model, background=None, chunk_size=1 << 20):
+    """
+    Yield (name, score, positions) for each record of a FASTA file: the log2
+    probability under model, or the log2 odds of model against background,
+    over the positions with a full context.
+    """
+    order = max(model.order, background.order if background is not None else 0)
+    name = None
+    total = 0.0
+    positions = 0
+    carry = numpy.zeros(0, dtype=numpy.uint8)
+    for record, start, chunk in fasta.streamFasta(filename, chunk_size):
+        if start == 0:
+            if name is not None:
+                yield name, total, positions
+            name, total, positions = record, 0.0, 0
+            carry = numpy.zeros(0, dtype=numpy.uint8)
+        codes = numpy.concatenate((carry, packedSeq.encode(chunk)))
+        # score positions with the context of the higher order model only,
+        # so model and background see the same positions
+        scores = model.positionScores(codes)[order - model.order:]
+        if background is not None:
+            scores = scores - background.positionScores(codes)[order - background.order:]
+        scored = ~numpy.isnan(scores)
+        total += float(scores[scored].sum())
+        positions += int(scored.sum())
+        carry = codes[max(0, len(codes) - order):] if order else codes[:0]
+    if name is not None:
+        yield name, total, positions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    commands = parser.add_subparsers(dest="command")
+
+    train = commands.add_parser("train", help="train a model from FASTA files")
+    train.add_argument("fasta", nargs="+", help="FASTA files to count")
+    train.add_argument("-k", "--order", type=int, default=1, help="order of the model (default 1)")
+    train.add_argument("-o", "--output", required=True, help="model file to write (.npz)")
+    train.add_argument("--pseudocount", type=float, default=1.0,
+                       help="added to every count (default 1)")
+
+    score = commands.add_parser("score", help="score the records of FASTA files")
+    score.add_argument("model", help="model file")
+    score.add_argument("fasta", nargs="+", help="FASTA files to score")
+    score.add_argument("--background", help="model file to compute log odds against")
+
+    args = parser.parse_args()
+    if args.command == "train":
+        model = MarkovModel(args.order, pseudocount=args.pseudocount)
+        for filename in args.fasta:
+            model.train(filename)
+        model.save(args.output)
+        print("{0}: order {1}, {2} (k+1)-mers counted".format(
+            args.output, model.order, int(model.counts.sum())))
+    elif args.command == "score":
+        model = MarkovModel.load(args.model)
+        background = MarkovModel.load(args.background) if args.background else None
+        for filename in args.fasta:
+            for name, total, positions in scoreRecords(filename, model, background):
+                print("{0}\t{1:.4f}\t{2}\t{3:.6f}".format(
+                    name, total, positions, total / positions if positions else 0.0))
+    else:
+        parser.print_help()
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -4,16 +4,37 @@
 course. Accepts two FASTA files as inputs, and outputs sequence alignment plus
 scores. """
 
-import sys
+import argparse
+import multiprocessing
+from collections import namedtuple
+
+import fasta
+
+try:
+    import numpy
+    from packedSeq import PackedSeq
+except ImportError:
+    numpy = None
+    PackedSeq = None
 
 base_idx = {'A': 0, 'G': 1, 'C': 2, 'T': 3 }
+if numpy is not None:
+    # ASCII -> base_idx code for encodeSeq, 255 for anything else
+    _base_lookup = numpy.full(256, 255, dtype=numpy.uint8)
+    for _base, _idx in base_idx.items():
+        _base_lookup[ord(_base)] = _idx
 PTR_NONE, PTR_GAP1, PTR_GAP2, PTR_BASE = 0, 1, 2, 3
+# Affine gap tables also flag cells whose gap extends the gap in the
+# previous cell rather than opening a new one
+PTR_MOVE, PTR_EXT1, PTR_EXT2 = 3, 4, 8
 
 def seqalignDP(seq1, seq2, subst_matrix, gap_penalty):
     """
     Return the score of the optimal Needdleman-Wunsch alignment for seq1
     and seq2.
     """
+    idx1 = seqCodes(seq1)
+    idx2 = seqCodes(seq2)
     F = [[0 for j in range(len(seq2)+1)] for i in range(len(seq1)+1)]
     TB = [[PTR_NONE for j in range(len(seq2)+1)] for i in range(len(seq1)+1)]
 
@@ -33,10 +54,10 @@ def seqalignDP(seq1, seq2, subst_matrix, gap_penalty):
             scores = [0,0,0] #Stores the possible scores from which the maximum will be calculated
 
             # Match/mismatch
-            scores[0] = F[i-1][j-1] + S[base_idx.get(seq1[i-1])][base_idx.get(seq2[j-1])]
+            scores[0] = F[i-1][j-1] + subst_matrix[idx1[i-1]][idx2[j-1]]
             #Gaps
-            scores[1] = F[i-1][j] - gap_penalty
-            scores[2] = F[i][j-1] - gap_penalty
+            scores[1] = F[i-1][j] - gap_penalty  # seq1[i-1] against a gap in seq2
+            scores[2] = F[i][j-1] - gap_penalty  # seq2[j-1] against a gap in seq1
 
             F[i][j] = max(scores) #determine the maximum to fill F
 
@@ -44,50 +65,752 @@ def seqalignDP(seq1, seq2, subst_matrix, gap_penalty):
             if max(scores) == scores[0]:
                 TB[i][j] = PTR_BASE
             elif max(scores) == scores[1]:
-                TB[i][j] = PTR_GAP1
-            elif max(scores) == scores[2]:
                 TB[i][j] = PTR_GAP2
+            elif max(scores) == scores[2]:
+                TB[i][j] = PTR_GAP1
 
     return F[len(seq1)][len(seq2)], F, TB
 
 def traceback(seq1, seq2, TB):
-    s1 = ""
-    s2 = ""
+    seq1 = str(seq1)
+    seq2 = str(seq2)
+    s1 = []
+    s2 = []
 
     i = len(seq1)
     j = len(seq2)
 
-    while TB[i][j] != PTR_NONE:
-        if TB[i][j] == PTR_BASE:
-            s1 = seq1[i-1] + s1
-            s2 = seq2[j-1] + s2
+    # walk back from the end, collecting the alignment in reverse. Inside an
+    # affine gap the move comes from the extension flags, not the cell.
+    move = TB[i][j] & PTR_MOVE
+    while move != PTR_NONE:
+        ptr = TB[i][j]
+        if move == PTR_BASE:
+            s1.append(seq1[i-1])
+            s2.append(seq2[j-1])
             i = i - 1
             j = j - 1
-        elif TB[i][j] == PTR_GAP1:
-            s1 = '-' + s1
-            s2 = seq2[j-1] + s2
+            move = TB[i][j] & PTR_MOVE
+        elif move == PTR_GAP1:
+            s1.append('-')
+            s2.append(seq2[j-1])
             j = j - 1
-        elif TB[i][j] == PTR_GAP2:
-            s1 = seq1[i-1] + s1
-            s2 = '-' + s2
+            move = PTR_GAP1 if ptr & PTR_EXT1 else TB[i][j] & PTR_MOVE
+        elif move == PTR_GAP2:
+            s1.append(seq1[i-1])
+            s2.append('-')
             i = i - 1
+            move = PTR_GAP2 if ptr & PTR_EXT2 else TB[i][j] & PTR_MOVE
         else:
             assert False
 
-    return s1, s2
+    return "".join(reversed(s1)), "".join(reversed(s2))
+
+
+def _isPacked(seq):
+    return PackedSeq is not None and isinstance(seq, PackedSeq)
+
+def seqCodes(seq):
+    """
+    Return the base_idx codes of seq (a string or a PackedSeq) as a list.
+    Raises ValueError for bases that cannot be scored, such as N.
+    """
+    if _isPacked(seq):
+        return encodeSeq(seq).tolist()
+    try:
+        return [base_idx[b] for b in seq]
+    except KeyError:
+        pos = [b in base_idx for b in seq].index(False)
+        raise ValueError("unknown base {0!r} at position {1}".format(seq[pos], pos))
+
+def encodeSeq(seq):
+    """Return seq as a numpy uint8 array of base_idx codes."""
+    if _isPacked(seq):
+        if seq.hasN():
+            pos = int(numpy.argmax(seq.mask()))
+            raise ValueError("unknown base 'N' at position {0}".format(pos))
+        return seq.codes()
+    codes = _base_lookup[numpy.frombuffer(seq.encode("ascii"), dtype=numpy.uint8)]
+    if (codes == 255).any():
+        pos = int(numpy.argmax(codes == 255))
+        raise ValueError("unknown base {0!r} at position {1}".format(seq[pos], pos))
+    return codes
+
+
+def _scoreType(subst_matrix, gap_penalty):
+    # integer scores stay integers, anything else becomes float
+    return numpy.asarray(list(numpy.ravel(subst_matrix)) + [gap_penalty]).dtype
+
+
+def seqalignDPNumpy(seq1, seq2, subst_matrix, gap_penalty, score_only=False):
+    """
+    NumPy version of seqalignDP, filling F one row at a time. Returns the
+    same score and an int8 TB array with the same pointers as seqalignDP;
+    F is not kept, so None is returned in its place. With score_only only
+    two rows are kept and TB is None as well.
+    """
+    if numpy is None:
+        raise ImportError("seqalignDPNumpy requires numpy")
+
+    n = len(seq1)
+    m = len(seq2)
+    c1 = encodeSeq(seq1)
+    c2 = encodeSeq(seq2)
+
+    dtype = _scoreType(subst_matrix, gap_penalty)
+    profile = numpy.asarray(subst_matrix, dtype=dtype)[:, c2]  # S row for every base vs seq2
+    colgaps = numpy.arange(m+1, dtype=dtype) * gap_penalty
+
+    TB = None
+    if not score_only:
+        TB = numpy.empty((n+1, m+1), dtype=numpy.int8)
+        TB[0, 0] = PTR_NONE
+        TB[0, 1:] = PTR_GAP1
+        TB[1:, 0] = PTR_GAP2
+
+    prev = -colgaps
+    cur = numpy.empty(m+1, dtype=dtype)
+    for i in range(1, n+1):
+        diag = prev[:-1] + profile[c1[i-1]]
+        up = prev[1:] - gap_penalty
+        cur[0] = 0 - i*gap_penalty
+        numpy.maximum(diag, up, out=cur[1:])
+
+        # F[i][j] = max(cur[j], F[i][j-1] - gap) unrolls to a running
+        # maximum of cur[k] - (j-k)*gap over k <= j
+        cur += colgaps
+        numpy.maximum.accumulate(cur, out=cur)
+        cur -= colgaps
+
+        if TB is not None:
+            # same preference order as seqalignDP: base, gap in seq2, gap in seq1
+            TB[i, 1:] = numpy.where(cur[1:] == diag, PTR_BASE,
+                                    numpy.where(cur[1:] == up, PTR_GAP2, PTR_GAP1))
+        prev, cur = cur, prev
+
+    return prev[m].item(), None, TB
+
+
+def scoreAlignment(s1, s2, subst_matrix, gap_penalty, gap_extend=None):
+    """
+    Return the score of two aligned strings as produced by traceback. With
+    gap_extend, gap_penalty is the cost of opening a gap and each further
+    position of the same gap costs gap_extend.
+    """
+    if gap_extend is None:
+        gap_extend = gap_penalty
+    score = 0
+    prev = None  # which string the previous column had a gap in
+    for a, b in zip(s1, s2):
+        if a == '-':
+            score -= gap_extend if prev == 1 else gap_penalty
+            prev = 1
+        elif b == '-':
+            score -= gap_extend if prev == 2 else gap_penalty
+            prev = 2
+        else:
+            score += subst_matrix[base_idx[a]][base_idx[b]]
+            prev = None
+    return score
 
 
-def readSeq(filename):
-    """Reads in a FASTA sequence. Assumes one sequence in the file"""
-    seq = []
+def lastRowDP(seq1, seq2, subst_matrix, gap_penalty):
+    """
+    Return the last row of the Needleman-Wunsch table F for seq1 and seq2.
+    Only two rows of F are kept in memory at any time.
+    """
+    idx1 = seqCodes(seq1)
+    idx2 = seqCodes(seq2)
+    prev = [0 - j*gap_penalty for j in range(len(seq2)+1)]
 
-    with open(filename, "r") as f:
-        for line in f:
-            if line.startswith(">"):
-                continue
-            seq.append(line.rstrip().upper())
+    for i in range(1, len(seq1)+1):
+        row = subst_matrix[idx1[i-1]]
+        left = prev[0] - gap_penalty
+        cur = [left]
+        for j in range(1, len(seq2)+1):
+            left = max(prev[j-1] + row[idx2[j-1]],
+                       prev[j] - gap_penalty,
+                       left - gap_penalty)
+            cur.append(left)
+        prev = cur
 
-    return "".join(seq)
+    return prev
+
+
+def seqalignScore(seq1, seq2, subst_matrix, gap_penalty):
+    """
+    Return the score of the optimal Needleman-Wunsch alignment for seq1 and
+    seq2 using O(len(seq2)) memory. No traceback is possible.
+    """
+    return lastRowDP(seq1, seq2, subst_matrix, gap_penalty)[-1]
+
+
+# Subproblems with at most this many cells are solved with the full table
+HIRSCHBERG_CUTOFF = 10000
+
+def seqalignHirschberg(seq1, seq2, subst_matrix, gap_penalty):
+    """
+    Return the score and the aligned strings of an optimal Needleman-Wunsch
+    alignment for seq1 and seq2, using Hirschberg's divide and conquer
+    algorithm (Durbin p.35). Memory is O(len(seq1)+len(seq2)).
+
+    When several alignments are optimal the one returned may differ from the
+    one found by traceback, but the score is the same.
+    """
+    seq1 = str(seq1)
+    seq2 = str(seq2)
+    s1 = []
+    s2 = []
+    _hirschberg(seq1, seq2, subst_matrix, gap_penalty, s1, s2)
+    s1 = "".join(s1)
+    s2 = "".join(s2)
+
+    return scoreAlignment(s1, s2, subst_matrix, gap_penalty), s1, s2
+
+def _hirschberg(seq1, seq2, subst_matrix, gap_penalty, s1, s2):
+    # Append the alignment of seq1 and seq2 to the s1 and s2 lists
+    if len(seq1) == 0:
+        s1.append('-'*len(seq2))
+        s2.append(seq2)
+    elif len(seq2) == 0:
+        s1.append(seq1)
+        s2.append('-'*len(seq1))
+    elif len(seq1) == 1 or len(seq1)*len(seq2) <= HIRSCHBERG_CUTOFF:
+        score, F, TB = seqalignDP(seq1, seq2, subst_matrix, gap_penalty)
+        a1, a2 = traceback(seq1, seq2, TB)
+        s1.append(a1)
+        s2.append(a2)
+    else:
+        # Split seq1 in half and find where an optimal path crosses the
+        # middle row, scoring the second half backwards from the end
+        mid = len(seq1)//2
+        n = len(seq2)
+        fwd = lastRowDP(seq1[:mid], seq2, subst_matrix, gap_penalty)
+        rev = lastRowDP(seq1[mid:][::-1], seq2[::-1], subst_matrix, gap_penalty)
+        split = max(range(n+1), key=lambda j: fwd[j] + rev[n-j])
+
+        _hirschberg(seq1[:mid], seq2[:split], subst_matrix, gap_penalty, s1, s2)
+        _hirschberg(seq1[mid:], seq2[split:], subst_matrix, gap_penalty, s1, s2)
+
+
+# Result of a banded or X-drop alignment. clipped is True when the band or
+# the dropped cells may have cut off a better alignment; run the full DP
+# instead. When X-drop dropped the end of the table, score and strings are
+# None.
+BandedAlignment = namedtuple("BandedAlignment", "score s1 s2 clipped")
+
+def _bandRow(prev, plo, lo, hi, i, row_scores, gap_penalty, neg):
+    """
+    Fill columns lo..hi of row i of F given the values prev of row i-1 for
+    the columns starting at plo. Cells outside the stored part of row i-1
+    count as unreachable (neg). Returns the new values and their pointers.
+    """
+    width = hi - lo + 1
+    # row i-1 over columns lo-1..hi
+    above = numpy.full(width + 1, neg, dtype=prev.dtype)
+    a = max(plo, lo - 1)
+    b = min(plo + len(prev) - 1, hi)
+    if a <= b:
+        above[a-lo+1:b-lo+2] = prev[a-plo:b-plo+1]
+
+    diag = above[:-1].copy()
+    if lo == 0:
+        diag[0] = neg
+        diag[1:] += row_scores[0:hi]
+    else:
+        diag += row_scores[lo-1:hi]
+    up = above[1:] - gap_penalty
+
+    cur = numpy.maximum(diag, up)
+    if lo == 0:
+        cur[0] = 0 - i*gap_penalty
+    colgaps = numpy.arange(width, dtype=cur.dtype) * gap_penalty
+    cur += colgaps
+    numpy.maximum.accumulate(cur, out=cur)
+    cur -= colgaps
+
+    ptrs = numpy.where(cur == diag, PTR_BASE,
+                       numpy.where(cur == up, PTR_GAP2, PTR_GAP1)).astype(numpy.int8)
+    if lo == 0:
+        ptrs[0] = PTR_GAP2
+    return cur, ptrs
+
+def _tracebackRows(seq1, seq2, rows):
+    """
+    traceback for tables stored as one (lo, hi, pointers) entry per row.
+    """
+    seq1 = str(seq1)
+    seq2 = str(seq2)
+    s1 = []
+    s2 = []
+
+    i = len(seq1)
+    j = len(seq2)
+
+    while True:
+        lo, hi, ptrs = rows[i]
+        ptr = ptrs[j-lo]
+        if ptr == PTR_NONE:
+            break
+        elif ptr == PTR_BASE:
+            s1.append(seq1[i-1])
+            s2.append(seq2[j-1])
+            i = i - 1
+            j = j - 1
+        elif ptr == PTR_GAP1:
+            s1.append('-')
+            s2.append(seq2[j-1])
+            j = j - 1
+        elif ptr == PTR_GAP2:
+            s1.append(seq1[i-1])
+            s2.append('-')
+            i = i - 1
+
+    return "".join(reversed(s1)), "".join(reversed(s2))
+
+def _firstRow(gap_penalty, hi, dtype):
+    values = 0 - numpy.arange(hi+1, dtype=dtype) * gap_penalty
+    ptrs = numpy.full(hi+1, PTR_GAP1, dtype=numpy.int8)
+    ptrs[0] = PTR_NONE
+    return values, ptrs
+
+def _unreachable(dtype):
+    if numpy.issubdtype(dtype, numpy.integer):
+        return numpy.iinfo(dtype).min // 4
+    return -numpy.inf
+
+def _suffixBound(a, b, smax, gap_penalty):
+    """Upper bound on the score of aligning a bases against b bases."""
+    k = numpy.minimum(a, b)
+    return numpy.maximum(k*smax - (a + b - 2*k)*gap_penalty, -(a + b)*gap_penalty)
+
+def _leavingBound(prev, plo, cur, lo, hi, i, row_scores, n, m, gap_penalty, smax):
+    """
+    Upper bound on the score of the paths whose first cell outside the band
+    is in row i: the banded score of the cell they leave from, plus the step
+    out of the band, plus the best possible score of the rest of the
+    alignment. A path leaves on the right at column hi+1, or on the left at
+    a column between the start of row i-1 and lo-1.
+    """
+    bound = None
+    if hi < m:
+        enter = cur[-1] - gap_penalty
+        if hi - plo < len(prev):
+            enter = max(enter, prev[hi-plo] + row_scores[hi])
+        bound = enter + _suffixBound(n - i, m - hi - 1, smax, gap_penalty)
+    if lo > plo:
+        js = numpy.arange(plo, lo)
+        enter = prev[js-plo] - gap_penalty
+        enter[1:] = numpy.maximum(enter[1:], prev[js[1:]-1-plo] + row_scores[js[1:]-1])
+        left = (enter + _suffixBound(n - i, m - js, smax, gap_penalty)).max()
+        bound = left if bound is None else max(bound, left)
+    return bound
+
+def seqalignBanded(seq1, seq2, subst_matrix, gap_penalty, band):
+    """
+    Needleman-Wunsch alignment restricted to cells within band columns of
+    the diagonal from (0,0) to (len(seq1),len(seq2)). Work and memory are
+    O(len(seq1)*band). Returns a BandedAlignment; clipped is set unless the
+    banded score is proven optimal: every path leaving the band is bounded
+    by the banded score of its last cell inside plus the best possible score
+    of the rest, and clipped means one of these bounds beats the result.
+    """
+    if numpy is None:
+        raise ImportError("seqalignBanded requires numpy")
+    if band < 1:
+        raise ValueError("band must be at least 1")
+
+    n = len(seq1)
+    m = len(seq2)
+    if n == 0 or m == 0:
+        s1 = str(seq1) + '-'*m
+        s2 = '-'*n + str(seq2)
+        return BandedAlignment(scoreAlignment(s1, s2, subst_matrix, gap_penalty), s1, s2, False)
+
+    # consecutive rows must overlap for the end to stay reachable
+    band = max(band, -(-m // n))
+
+    c1 = encodeSeq(seq1)
+    dtype = _scoreType(subst_matrix, gap_penalty)
+    profile = numpy.asarray(subst_matrix, dtype=dtype)[:, encodeSeq(seq2)]
+    neg = _unreachable(dtype)
+    smax = numpy.asarray(subst_matrix, dtype=dtype).max()
+
+    hi = min(m, band)
+    prev, ptrs = _firstRow(gap_penalty, hi, dtype)
+    plo = 0
+    rows = [(0, hi, ptrs)]
+    # best score of the paths leaving the band, starting with row 0
+    leaving = None
+    if hi < m:
+        leaving = prev[-1] - gap_penalty + _suffixBound(n, m - hi - 1, smax, gap_penalty)
+    for i in range(1, n+1):
+        center = (i*m) // n
+        lo = max(0, center - band)
+        hi = min(m, center + band)
+        row_scores = profile[c1[i-1]]
+        cur, ptrs = _bandRow(prev, plo, lo, hi, i, row_scores, gap_penalty, neg)
+        bound = _leavingBound(prev, plo, cur, lo, hi, i, row_scores, n, m, gap_penalty, smax)
+        if bound is not None and (leaving is None or bound > leaving):
+            leaving = bound
+        prev = cur
+        plo = lo
+        rows.append((lo, hi, ptrs))
+
+    score = prev[m-plo].item()
+    s1, s2 = _tracebackRows(seq1, seq2, rows)
+    return BandedAlignment(score, s1, s2, leaving is not None and leaving.item() > score)
+
+def seqalignXDrop(seq1, seq2, subst_matrix, gap_penalty, xdrop):
+    """
+    Needleman-Wunsch alignment that only keeps cells scoring within xdrop
+    of the best score seen so far, so the band follows the alignment and
+    widens where the score stays high. Returns a BandedAlignment; clipped
+    is set (with no score or alignment) when the end of the table was
+    dropped, and otherwise unless the score is proven optimal: as in
+    seqalignBanded, a path through a dropped cell is bounded by the score of
+    that cell plus the best possible score of the rest of the alignment.
+    """
+    if numpy is None:
+        raise ImportError("seqalignXDrop requires numpy")
+
+    n = len(seq1)
+    m = len(seq2)
+    c1 = encodeSeq(seq1)
+    dtype = _scoreType(subst_matrix, gap_penalty)
+    profile = numpy.asarray(subst_matrix, dtype=dtype)[:, encodeSeq(seq2)]
+    neg = _unreachable(dtype)
+    smax = numpy.asarray(subst_matrix, dtype=dtype).max()
+    # past this many horizontal gaps a cell is always dropped
+    reach = int(xdrop // gap_penalty)
+
+    hi = min(m, reach)
+    prev, ptrs = _firstRow(gap_penalty, hi, dtype)
+    plo = 0
+    best = 0
+    rows = [(0, hi, ptrs)]
+    # best score of the paths through a dropped or never computed cell; the
+    # only cells a kept path can reach without being computed are those right
+    # of hi
+    leaving = None
+    if hi < m:
+        leaving = prev[-1] - gap_penalty + _suffixBound(n, m - hi - 1, smax, gap_penalty)
+    for i in range(1, n+1):
+        lo = plo
+        hi = min(m, plo + len(prev) + reach)
+        cur, ptrs = _bandRow(prev, plo, lo, hi, i, profile[c1[i-1]], gap_penalty, neg)
+        best = max(best, cur.max().item())
+
+        dropped = cur < best - xdrop
+        bounds = []
+        if dropped.any():
+            js = lo + numpy.nonzero(dropped)[0]
+            bounds.append((cur[dropped] + _suffixBound(n - i, m - js, smax, gap_penalty)).max())
+        if hi < m:
+            bounds.append(cur[-1] - gap_penalty + _suffixBound(n - i, m - hi - 1, smax, gap_penalty))
+        for bound in bounds:
+            if leaving is None or bound > leaving:
+                leaving = bound
+
+        keep = numpy.nonzero(~dropped)[0]
+        if len(keep) == 0:
+            return BandedAlignment(None, None, None, True)
+        first = keep[0]
+        last = keep[-1]
+        cur = cur[first:last+1]
+        cur[dropped[first:last+1]] = neg
+        prev = cur
+        plo = lo + first
+        rows.append((plo, lo + last, ptrs[first:last+1]))
+
+    if plo + len(prev) - 1 != m:
+        return BandedAlignment(None, None, None, True)
+    score = prev[-1].item()
+    s1, s2 = _tracebackRows(seq1, seq2, rows)
+    return BandedAlignment(score, s1, s2, leaving is not None and leaving.item() > score)
+
+
+def _affineRow(prevH, prevX, H0, row_scores, gap_open, gap_extend):
+    """
+    Fill one row of Gotoh's tables (Durbin p.29) given row i-1. H holds the
+    best score of any alignment ending in a cell, X the best one ending with
+    seq1[i-1] against a gap in seq2 and Y the best one ending with a gap in
+    seq1. H0 is the value of column 0. Returns H, X and the pointers.
+    """
+    X = numpy.maximum(prevH - gap_open, prevX - gap_extend)
+    X[0] = H0
+    D = prevH[:-1] + row_scores
+
+    T = numpy.empty_like(prevH)
+    T[0] = H0
+    numpy.maximum(D, X[1:], out=T[1:])
+
+    # Y[j] = max(H[j-1] - gap_open, Y[j-1] - gap_extend) unrolls to a running
+    # maximum over T, since reopening a gap after a gap never scores better
+    # than extending it when gap_open >= gap_extend
+    colgaps = numpy.arange(len(T), dtype=T.dtype) * gap_extend
+    Y = numpy.maximum.accumulate(T + colgaps)
+    Y = Y[:-1] - colgaps[:-1] - gap_open
+    H = T.copy()
+    numpy.maximum(T[1:], Y, out=H[1:])
+
+    ptrs = numpy.empty(len(H), dtype=numpy.int8)
+    ptrs[0] = PTR_GAP2
+    ptrs[1:] = numpy.where(H[1:] == D, PTR_BASE,
+                           numpy.where(H[1:] == X[1:], PTR_GAP2, PTR_GAP1))
+    ptrs[1:] |= numpy.where(prevX[1:] - gap_extend > prevH[1:] - gap_open,
+                            PTR_EXT2, 0).astype(numpy.int8)
+    ptrs[2:] |= numpy.where(Y[:-1] - gap_extend > H[1:-1] - gap_open,
+                            PTR_EXT1, 0).astype(numpy.int8)
+    return H, X, ptrs
+
+def _affineFirstRow(m, gap_open, gap_extend, dtype):
+    H = numpy.zeros(m+1, dtype=dtype)
+    H[1:] = 0 - gap_open - numpy.arange(m, dtype=dtype) * gap_extend
+    X = numpy.full(m+1, _unreachable(dtype), dtype=dtype)
+    return H, X
+
+def _checkGaps(gap_open, gap_extend):
+    if gap_extend > gap_open:
+        raise ValueError("gap_extend must not be larger than gap_open")
+
+def seqalignAffine(seq1, seq2, subst_matrix, gap_open, gap_extend, score_only=False):
+    """
+    Needleman-Wunsch alignment with affine gaps: a gap of length L costs
+    gap_open + (L-1)*gap_extend. Returns the score, None and an int8 TB
+    array for traceback, like seqalignDPNumpy; the three Gotoh tables are
+    kept as two rows and folded into the one pointer array.
+    """
+    if numpy is None:
+        raise ImportError("seqalignAffine requires numpy")
+    _checkGaps(gap_open, gap_extend)
+
+    n = len(seq1)
+    m = len(seq2)
+    c1 = encodeSeq(seq1)
+    dtype = _scoreType(subst_matrix, gap_open + gap_extend)
+    profile = numpy.asarray(subst_matrix, dtype=dtype)[:, encodeSeq(seq2)]
+
+    TB = None
+    if not score_only:
+        TB = numpy.empty((n+1, m+1), dtype=numpy.int8)
+        TB[0, 0] = PTR_NONE
+        TB[0, 1:2] = PTR_GAP1
+        TB[0, 2:] = PTR_GAP1 | PTR_EXT1
+
+    H, X = _affineFirstRow(m, gap_open, gap_extend, dtype)
+    for i in range(1, n+1):
+        H0 = 0 - gap_open - (i-1)*gap_extend
+        H, X, ptrs = _affineRow(H, X, H0, profile[c1[i-1]], gap_open, gap_extend)
+        if TB is not None:
+            TB[i] = ptrs
+            if i > 1:
+                TB[i, 0] |= PTR_EXT2
+
+    return H[m].item(), None, TB
+
+def seqalignAffineLinear(seq1, seq2, subst_matrix, gap_open, gap_extend):
+    """
+    Return the score and aligned strings of an optimal affine gap alignment
+    for seq1 and seq2 in O(len(seq1)+len(seq2)) memory, using the Myers and
+    Miller (1988) extension of Hirschberg's algorithm.
+    """
+    if numpy is None:
+        raise ImportError("seqalignAffineLinear requires numpy")
+    _checkGaps(gap_open, gap_extend)
+
+    seq1 = str(seq1)
+    seq2 = str(seq2)
+    dtype = _scoreType(subst_matrix, gap_open + gap_extend)
+    S_arr = numpy.asarray(subst_matrix, dtype=dtype)
+    s1 = []
+    s2 = []
+    # in Myers and Miller's terms a gap of length L costs g + h*L
+    g = gap_open - gap_extend
+    _myersMiller(seq1, seq2, S_arr, g, gap_extend, g, g, s1, s2)
+    s1 = "".join(s1)
+    s2 = "".join(s2)
+
+    return scoreAlignment(s1, s2, subst_matrix, gap_open, gap_extend), s1, s2
+
+def _affineLastRow(seq1, seq2, S_arr, g, h, tb):
+    # Last rows of H and X for seq1 against seq2, where a gap in seq2 at the
+    # start costs tb + h*L instead of g + h*L
+    H, X = _affineFirstRow(len(seq2), g + h, h, S_arr.dtype)
+    profile = S_arr[:, encodeSeq(seq2)]
+    for i, c in enumerate(encodeSeq(seq1)):
+        H0 = 0 - tb - (i+1)*h
+        H, X, ptrs = _affineRow(H, X, H0, profile[c], g + h, h)
+    return H, X
+
+def _myersMiller(seq1, seq2, S_arr, g, h, tb, te, s1, s2):
+    # Append the alignment of seq1 and seq2 to the s1 and s2 lists. tb and te
+    # replace g for a gap in seq2 touching the start or the end, so that a
+    # gap split between two subproblems is only opened once.
+    m = len(seq1)
+    n = len(seq2)
+    if n == 0:
+        s1.append(seq1)
+        s2.append('-'*m)
+    elif m == 0:
+        s1.append('-'*n)
+        s2.append(seq2)
+    elif m == 1:
+        # either seq1 is deleted, or it is matched to one base of seq2
+        def gap(k):
+            return g + h*k if k > 0 else 0
+        row = S_arr[base_idx[seq1]]
+        best = 0 - min(tb, te) - h - gap(n)
+        bestj = 0
+        for j in range(1, n+1):
+            score = row[base_idx[seq2[j-1]]] - gap(j-1) - gap(n-j)
+            if score > best:
+                best = score
+                bestj = j
+        if bestj == 0 and tb <= te:
+            s1.append(seq1 + '-'*n)
+            s2.append('-' + seq2)
+        elif bestj == 0:
+            s1.append('-'*n + seq1)
+            s2.append(seq2 + '-')
+        else:
+            s1.append('-'*(bestj-1) + seq1 + '-'*(n-bestj))
+            s2.append(seq2)
+    else:
+        mid = m//2
+        CC, DD = _affineLastRow(seq1[:mid], seq2, S_arr, g, h, tb)
+        RR, SS = _affineLastRow(seq1[mid:][::-1], seq2[::-1], S_arr, g, h, te)
+        RR = RR[::-1]
+        SS = SS[::-1]
+
+        # type 1 crosses the middle at (mid, j); type 2 has one gap in seq2
+        # spanning seq1[mid-1] and seq1[mid], counted as opened only once
+        through = CC + RR
+        gapped = DD + SS + g
+        j1 = int(numpy.argmax(through))
+        j2 = int(numpy.argmax(gapped))
+        if through[j1] >= gapped[j2]:
+            _myersMiller(seq1[:mid], seq2[:j1], S_arr, g, h, tb, g, s1, s2)
+            _myersMiller(seq1[mid:], seq2[j1:], S_arr, g, h, g, te, s1, s2)
+        else:
+            _myersMiller(seq1[:mid-1], seq2[:j2], S_arr, g, h, tb, 0, s1, s2)
+            s1.append(seq1[mid-1:mid+1])
+            s2.append('--')
+            _myersMiller(seq1[mid+1:], seq2[j2:], S_arr, g, h, 0, te, s1, s2)
+
+
+def selfScore(seq, subst_matrix, gap_penalty, gap_extend=None):
+    """
+    Return the score of seq aligned against itself in O(len(seq)). When no
+    substitution scores better than the average of the two matching
+    diagonal entries and those are not negative, the gapless alignment of
+    seq with itself is optimal and its score is the sum of the diagonal
+    entries. Otherwise the DP is run.
+    """
+    n = len(subst_matrix)
+    diagonal = all(subst_matrix[a][a] >= 0 and
+                   2*subst_matrix[a][b] <= subst_matrix[a][a] + subst_matrix[b][b]
+                   for a in range(n) for b in range(n))
+    if diagonal and gap_penalty >= 0:
+        counts = dict((base, seq.count(base)) for base in base_idx)
+        if sum(counts.values()) == len(seq):
+            return sum(count * subst_matrix[base_idx[base]][base_idx[base]]
+                       for base, count in counts.items())
+
+    if gap_extend is not None:
+        return seqalignAffine(seq, seq, subst_matrix, gap_penalty, gap_extend, score_only=True)[0]
+    return seqalignScore(seq, seq, subst_matrix, gap_penalty)
+
+
+# Sequences and scoring shared with the all-pairs worker processes, set once
+# per worker so that jobs only carry the indices of the pair
+_pairData = None
+
+def _initPairWorker(seqs, subst_matrix, gap_penalty):
+    global _pairData
+    _pairData = (seqs, subst_matrix, gap_penalty)
+
+def _pairScore(pair):
+    seqs, subst_matrix, gap_penalty = _pairData
+    i, j = pair
+    score = seqalignDPNumpy(seqs[i], seqs[j], subst_matrix, gap_penalty, score_only=True)[0]
+    return i, j, score
+
+def allPairsDistances(seqs, subst_matrix, gap_penalty, processes=None, chunksize=None):
+    """
+    Align every pair of sequences (score only) over a pool of processes and
+    return the N x N distance matrix, where entry [i][j] is
+    1 - score(i,j)/max(selfScore(i), selfScore(j)). Unlike the distance of
+    main, which divides by the self score of the first sequence, this is
+    symmetric, as tree building methods such as neighbor-joining and UPGMA
+    expect. Each pair is aligned once.
+    """
+    if numpy is None:
+        raise ImportError("allPairsDistances requires numpy")
+
+    n = len(seqs)
+    selfscores = numpy.array([selfScore(seq, subst_matrix, gap_penalty) for seq in seqs],
+                             dtype=float)
+    scores = numpy.zeros((n, n))
+    scores[numpy.diag_indices(n)] = selfscores
+
+    # largest jobs first so the pool does not end waiting on one long pair
+    pairs = [(i, j) for i in range(n) for j in range(i+1, n)]
+    pairs.sort(key=lambda p: len(seqs[p[0]]) * len(seqs[p[1]]), reverse=True)
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if chunksize is None:
+        chunksize = max(1, len(pairs) // (4*processes))
+
+    if processes == 1:
+        _initPairWorker(seqs, subst_matrix, gap_penalty)
+        results = map(_pairScore, pairs)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes, _initPairWorker,
+                                    (seqs, subst_matrix, gap_penalty))
+        results = pool.imap_unordered(_pairScore, pairs, chunksize)
+    try:
+        for i, j, score in results:
+            scores[i, j] = scores[j, i] = score
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return 1.0 - scores / numpy.maximum(selfscores[:, None], selfscores[None, :])
+
+def writeDistances(filename, names, D):
+    """Write a distance matrix as .npy if filename ends in .npy, else as TSV."""
+    if filename.endswith(".npy"):
+        numpy.save(filename, D)
+        return
+    with open(filename, "w") as f:
+        f.write("\t" + "\t".join(names) + "\n")
+        for name, row in zip(names, D):
+            f.write(name + "\t" + "\t".join("{0:.6f}".format(x) for x in row) + "\n")
+
+
+def readSeq(filename, region=None, packed=False):
+    """
+    Reads in a FASTA sequence: the first record of the file, or a region
+    such as chr7:26703024-27706250 read through the file's .fai index.
+    With packed, the sequence is returned as a PackedSeq, built chunk by
+    chunk so the whole record is never held as text.
+    """
+    if region is not None:
+        with fasta.FastaFile(filename) as fa:
+            seq = fa.region(region)
+        return PackedSeq(seq) if packed else seq
+
+    if packed:
+        chunks = fasta.streamFasta(filename, max_records=1)
+        return PackedSeq.fromChunks(chunk for name, start, chunk in chunks)
+
+    for name, seq in fasta.readFasta(filename):
+        return seq
+    return ""
 
 # Substituation matrix and gap_penalty
 S = [
@@ -102,23 +825,93 @@ gap_penalty = 4
 
 def main():
     # parse command line
-    if len(sys.argv) < 3:
-        print("Usage: {0} <FASTA 1> <FASTA 2>".format(sys.argv[0]))
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("fasta1", help="FASTA file with the first sequence")
+    parser.add_argument("fasta2", nargs="?",
+                        help="FASTA file with the second sequence")
+    parser.add_argument("--mode", default="full",
+                        choices=("full", "numpy", "linear", "score", "banded", "xdrop"),
+                        help="full: full DP table and traceback (default); "
+                        "numpy: full DP filled with NumPy; "
+                        "linear: Hirschberg alignment in linear memory; "
+                        "score: score only, keeping two rows of the table; "
+                        "banded: only cells within --band of the diagonal; "
+                        "xdrop: only cells within --xdrop of the best score")
+    parser.add_argument("--band", type=int, default=100,
+                        help="band half-width for --mode banded (default 100)")
+    parser.add_argument("--xdrop", type=int, default=50,
+                        help="score drop for --mode xdrop (default 50)")
+    parser.add_argument("--gap-open", type=int,
+                        help="use affine gaps with this gap opening penalty "
+                        "(modes full, numpy, linear and score)")
+    parser.add_argument("--gap-extend", type=int, default=1,
+                        help="gap extension penalty for affine gaps (default 1)")
+    parser.add_argument("--region1",
+                        help="align only this region of FASTA 1 (name:start-end)")
+    parser.add_argument("--region2",
+                        help="align only this region of FASTA 2 (name:start-end)")
+    parser.add_argument("--all-pairs", metavar="OUTPUT",
+                        help="align every pair of records of FASTA 1 and write "
+                        "the symmetric distance matrix 1 - score(i,j) / "
+                        "max(selfscore(i), selfscore(j)) to OUTPUT (.npy or TSV)")
+    parser.add_argument("--processes", type=int,
+                        help="worker processes for --all-pairs (default: all CPUs)")
+    args = parser.parse_args()
 
-    file1 = sys.argv[1]
-    file2 = sys.argv[2]
+    if args.all_pairs:
+        records = list(fasta.readFasta(args.fasta1))
+        names = [name for name, seq in records]
+        D = allPairsDistances([seq for name, seq in records], S, gap_penalty,
+                              processes=args.processes)
+        writeDistances(args.all_pairs, names, D)
+        return
+    if args.fasta2 is None:
+        parser.error("FASTA 2 is required unless --all-pairs is given")
+    if args.gap_open is not None and args.mode in ("banded", "xdrop"):
+        parser.error("affine gaps are not available with --mode " + args.mode)
 
-    seq1 = readSeq(file1)
-    seq2 = readSeq(file2)
+    seq1 = readSeq(args.fasta1, args.region1)
+    seq2 = readSeq(args.fasta2, args.region2)
 
-    score, F, TB = seqalignDP(seq1, seq2, S, gap_penalty)
+    if args.gap_open is not None:
+        gaps = (args.gap_open, args.gap_extend)
+        if args.mode == "linear":
+            score, s1, s2 = seqalignAffineLinear(seq1, seq2, S, *gaps)
+        else:
+            score, F, TB = seqalignAffine(seq1, seq2, S, *gaps,
+                                          score_only=(args.mode == "score"))
+            if TB is not None:
+                s1, s2 = traceback(seq1, seq2, TB)
+    elif args.mode == "full":
+        score, F, TB = seqalignDP(seq1, seq2, S, gap_penalty)
+        s1, s2 = traceback(seq1, seq2, TB)
+    elif args.mode == "numpy":
+        score, F, TB = seqalignDPNumpy(seq1, seq2, S, gap_penalty)
+        s1, s2 = traceback(seq1, seq2, TB)
+    elif args.mode == "linear":
+        score, s1, s2 = seqalignHirschberg(seq1, seq2, S, gap_penalty)
+    elif args.mode in ("banded", "xdrop"):
+        if args.mode == "banded":
+            result = seqalignBanded(seq1, seq2, S, gap_penalty, args.band)
+        else:
+            result = seqalignXDrop(seq1, seq2, S, gap_penalty, args.xdrop)
+        score, s1, s2 = result.score, result.s1, result.s2
+        if result.clipped:
+            print("{0} alignment may not be optimal, "
+                  "falling back to the full DP".format(args.mode))
+            score, F, TB = seqalignDPNumpy(seq1, seq2, S, gap_penalty)
+            s1, s2 = traceback(seq1, seq2, TB)
+    else:
+        score = seqalignScore(seq1, seq2, S, gap_penalty)
 
-    s1, s2 = traceback(seq1, seq2, TB)
-    print(s1)
-    print(s2)
+    if args.mode != "score":
+        print(s1)
+        print(s2)
 
-    perfectscore, perfF, perfTB = seqalignDP(seq1, seq1, S, gap_penalty)
+    if args.gap_open is not None:
+        perfectscore = selfScore(seq1, S, *gaps)
+    else:
+        perfectscore = selfScore(seq1, S, gap_penalty)
 
     """     To define a distance metric assuming a positive score, the
     perfectscore of a sequence aligned against itself is calculated. The
@@ -129,8 +922,8 @@ def main():
     distance = 1.0-score/float(perfectscore)
 
     print("Score: {0}".format(score))
-    print "perfectscore = "+str(perfectscore)
-    print "Distance = "+str(distance)
+    print("perfectscore = "+str(perfectscore))
+    print("Distance = "+str(distance))
 
 if __name__ == "__main__":
     main()
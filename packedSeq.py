@@ -0,0 +1,254 @@
+""" Compact DNA sequences stored with 2 bits per base, four bases to a byte.
+Positions that are not A, C, G or T (N and the other IUPAC codes) are kept as
+a list of masked intervals and read back as N. Codes follow base_idx in
+needlemanWunsch (A=0, G=1, C=2, T=3), so the complement of a code is 3 minus
+the code. """
+
+import numpy
+
+BASES = "AGCT"
+N = 4  # code used for masked positions by unpacked arrays
+
+# ASCII -> code, 4 for the IUPAC ambiguity codes, 255 for anything else
+_lookup = numpy.full(256, 255, dtype=numpy.uint8)
+for _code, _base in enumerate(BASES):
+    _lookup[ord(_base)] = _lookup[ord(_base.lower())] = _code
+for _base in "NRYKMSWBDHV":
+    _lookup[ord(_base)] = _lookup[ord(_base.lower())] = N
+_shifts = numpy.array([6, 4, 2, 0], dtype=numpy.uint8)
+
+
+def encode(seq):
+    """
+    Return a uint8 array of codes for a DNA string, with N (4) at every
+    ambiguous position. Raises ValueError on characters that are not bases.
+    """
+    codes = _lookup[numpy.frombuffer(seq.encode("ascii"), dtype=numpy.uint8)]
+    bad = codes == 255
+    if bad.any():
+        pos = int(numpy.argmax(bad))
+        raise ValueError("not a base: {0!r} at position {1}".format(seq[pos], pos))
+    return codes
+
+
+def _pack(codes):
+    # 2-bit codes (masked positions stored as 0) -> packed bytes
+    codes = numpy.where(codes == N, 0, codes).astype(numpy.uint8)
+    padded = numpy.zeros(-(-len(codes) // 4) * 4, dtype=numpy.uint8)
+    padded[:len(codes)] = codes
+    quads = padded.reshape(-1, 4)
+    return (quads[:, 0] << 6) | (quads[:, 1] << 4) | (quads[:, 2] << 2) | quads[:, 3]
+
+
+def _runs(mask):
+    # start and end of the runs of True in a boolean array
+    edges = numpy.diff(numpy.concatenate(([0], mask.view(numpy.int8), [0])))
+    return numpy.nonzero(edges == 1)[0], numpy.nonzero(edges == -1)[0]
+
+
+def kmerCodes(codes, k):
+    """
+    int64 array with the 2k-bit code of the k-mer starting at every
+    position of an array of codes (len - k + 1 of them), built by rolling
+    the codes in 2 bits at a time; -1 where the k-mer overlaps an N.
+    """
+    if k > 31:
+        raise ValueError("k-mers longer than 31 do not fit 64 bits")
+    codes = numpy.asarray(codes)
+    count = len(codes) - k + 1
+    if count <= 0:
+        return numpy.zeros(0, dtype=numpy.int64)
+    masked = codes == N
+    bits = numpy.where(masked, 0, codes).astype(numpy.int64)
+    values = numpy.zeros(count, dtype=numpy.int64)
+    for offset in range(k):
+        values <<= 2
+        values |= bits[offset:offset+count]
+    if masked.any():
+        # a k-mer is bad when any of its positions is masked
+        nmask = numpy.concatenate(([0], numpy.cumsum(masked)))
+        values[nmask[k:] - nmask[:count] > 0] = -1
+    return values
+
+
+class PackedSeq(object):
+    """
+    A DNA sequence packed 2 bits per base. Supports len, indexing and
+    slicing (which return str and PackedSeq), iteration, str, count,
+    reverse complement and k-mer extraction, so it can be passed wherever a
+    sequence string is read base by base.
+    """
+
+    def __init__(self, seq=""):
+        codes = encode(seq) if isinstance(seq, str) else numpy.asarray(seq, dtype=numpy.uint8)
+        self._setCodes(codes)
+
+    def _setCodes(self, codes):
+        self._length = len(codes)
+        self._data = _pack(codes)
+        self._nstart, self._nend = _runs(codes == N)
+
+    @classmethod
+    def fromCodes(cls, codes):
+        """Build a PackedSeq from an array of codes (4 for masked positions)."""
+        return cls(codes)
+
+    @classmethod
+    def fromChunks(cls, chunks):
+        """
+        Build a PackedSeq from an iterable of strings, such as the chunks of
+        fasta.streamFasta, without holding the whole sequence as text.
+        """
+        parts = []
+        nstarts = []
+        nends = []
+        length = 0
+        carry = numpy.zeros(0, dtype=numpy.uint8)
+        for chunk in chunks:
+            codes = numpy.concatenate((carry, encode(chunk)))
+            whole = len(codes) - len(codes) % 4
+            starts, ends = _runs(codes[:whole] == N)
+            nstarts.append(starts + length)
+            nends.append(ends + length)
+            parts.append(_pack(codes[:whole]))
+            length += whole
+            carry = codes[whole:]
+        starts, ends = _runs(carry == N)
+        nstarts.append(starts + length)
+        nends.append(ends + length)
+        parts.append(_pack(carry))
+        length += len(carry)
+
+        seq = cls()
+        seq._length = length
+        seq._data = numpy.concatenate(parts)
+        seq._nstart, seq._nend = cls._mergeRuns(numpy.concatenate(nstarts),
+                                                numpy.concatenate(nends))
+        return seq
+
+    @staticmethod
+    def _mergeRuns(starts, ends):
+        # join runs that touch across chunk boundaries
+        if len(starts) < 2:
+            return starts, ends
+        keep = numpy.ones(len(starts), dtype=bool)
+        keep[1:] = starts[1:] != ends[:-1]
+        return starts[keep], ends[numpy.concatenate((keep[1:], [True]))]
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def nbytes(self):
+        """Memory used by the packed bases and the mask."""
+        return self._data.nbytes + self._nstart.nbytes + self._nend.nbytes
+
+    def mask(self, start=0, end=None):
+        """Boolean array, True at masked (N) positions from start to end."""
+        end = self._length if end is None else end
+        mask = numpy.zeros(max(0, end - start), dtype=bool)
+        # intervals are sorted and disjoint, so only a run of them overlaps
+        first = numpy.searchsorted(self._nend, start, side="right")
+        last = numpy.searchsorted(self._nstart, end, side="left")
+        for s, e in zip(self._nstart[first:last], self._nend[first:last]):
+            mask[max(s, start) - start:min(e, end) - start] = True
+        return mask
+
+    def codes(self, start=0, end=None, masked=True):
+        """
+        uint8 array of the codes from start to end. Masked positions are N
+        (4), or the 2-bit placeholder 0 when masked is False.
+        """
+        end = self._length if end is None else min(end, self._length)
+        start = min(start, end)
+        first = start // 4
+        quads = self._data[first:-(-end // 4)]
+        codes = ((quads[:, None] >> _shifts) & 3).ravel()
+        codes = codes[start - 4*first:end - 4*first]
+        if masked and len(self._nstart):
+            codes[self.mask(start, end)] = N
+        return codes
+
+    def hasN(self):
+        return len(self._nstart) > 0
+
+    def maskN(self, start, end):
+        """Mask positions start to end (0-based, end exclusive) as N."""
+        start = max(0, start)
+        end = min(end, self._length)
+        if start >= end:
+            return
+        starts = numpy.append(self._nstart, start)
+        ends = numpy.append(self._nend, end)
+        order = numpy.argsort(starts, kind="mergesort")
+        starts, ends = starts[order], ends[order]
+        # merge overlapping intervals
+        ends = numpy.maximum.accumulate(ends)
+        keep = numpy.ones(len(starts), dtype=bool)
+        keep[1:] = starts[1:] > ends[:-1]
+        group = numpy.cumsum(keep) - 1
+        self._nstart = starts[keep]
+        self._nend = numpy.zeros(len(self._nstart), dtype=ends.dtype)
+        numpy.maximum.at(self._nend, group, ends)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self._length)
+            if step == 1:
+                return PackedSeq(self.codes(start, stop))
+            return PackedSeq(self.codes()[key])
+        if key < 0:
+            key += self._length
+        if not 0 <= key < self._length:
+            raise IndexError("PackedSeq index out of range")
+        return "AGCTN"[self.codes(key, key+1)[0]]
+
+    def __iter__(self):
+        step = 1 << 16
+        for start in range(0, self._length, step):
+            for base in str(self[start:start+step]):
+                yield base
+
+    def __str__(self):
+        return numpy.frombuffer(b"AGCTN", dtype=numpy.uint8)[self.codes()].tobytes().decode("ascii")
+
+    def __repr__(self):
+        text = str(self[:20]) + ("..." if self._length > 20 else "")
+        return "PackedSeq({0!r}, length={1})".format(text, self._length)
+
+    def __eq__(self, other):
+        if isinstance(other, PackedSeq):
+            return (self._length == other._length and
+                    numpy.array_equal(self.codes(), other.codes()))
+        if isinstance(other, str):
+            return str(self) == other.upper()
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __add__(self, other):
+        if not isinstance(other, PackedSeq):
+            other = PackedSeq(other)
+        return PackedSeq(numpy.concatenate((self.codes(), other.codes())))
+
+    def count(self, base):
+        """Number of occurrences of a single base (A, C, G, T or N)."""
+        code = "AGCTN".index(base.upper())
+        if code == N:
+            return int((self._nend - self._nstart).sum())
+        return int(numpy.count_nonzero(self.codes() == code))
+
+    def reverseComplement(self):
+        codes = self.codes()[::-1]
+        return PackedSeq(numpy.where(codes == N, N, 3 - codes))
+
+    def kmers(self, k):
+        """
+        int64 array with the 2k-bit code of the k-mer starting at every
+        position (len - k + 1 of them), -1 where the k-mer overlaps an N.
+        """
+        return kmerCodes(self.codes(), k)
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+
+""" Smith-Waterman local alignment for BE 562 sequences, using the same
+substitution matrix and gap penalty as needlemanWunsch. Finds the best
+non-overlapping local hits of a short query (e.g. HoxA13) in a long target
+(e.g. the 1 Mb hoxa region) on one or both strands. """
+
+import argparse
+from collections import namedtuple
+
+import numpy
+
+import packedSeq
+from needlemanWunsch import (S, gap_penalty, readSeq, traceback, encodeSeq,
+                             PTR_NONE, PTR_GAP1, PTR_GAP2, PTR_BASE)
+
+# A local hit: query[qstart:qend] aligned to target[tstart:tend] (0-based,
+# end exclusive, forward strand coordinates) as the strings s1 and s2. On
+# the - strand s2 is the reverse complement of the target region.
+LocalHit = namedtuple("LocalHit", "score qstart qend tstart tend strand s1 s2")
+
+
+def targetProfile(tcodes, subst_matrix):
+    """
+    Profile of the target: row a holds the score of base a against every
+    target position, so a query row of the DP is a single gather. Masked
+    target positions (N) get the lowest score of the matrix.
+    """
+    Sx = numpy.empty((4, 5), dtype=numpy.int32)
+    Sx[:, :4] = numpy.asarray(subst_matrix)
+    Sx[:, 4] = Sx[:, :4].min()
+    return Sx[:, tcodes]
+
+
+def _scanChunk(qcodes, profile, gap):
+    """
+    Run the Smith-Waterman recursion for the whole query over one chunk of
+    the target, one query row at a time with the target as the vector
+    dimension. Returns, for every target column, the best score of an
+    alignment ending there and the query row it ends on.
+    """
+    L = profile.shape[1]
+    colgaps = numpy.arange(L+1, dtype=numpy.int32) * gap
+    prev = numpy.zeros(L+1, dtype=numpy.int32)
+    cur = numpy.zeros(L+1, dtype=numpy.int32)
+    best = numpy.zeros(L+1, dtype=numpy.int32)
+    bestrow = numpy.zeros(L+1, dtype=numpy.int32)
+
+    for i, a in enumerate(qcodes):
+        row = cur[1:]
+        numpy.add(prev[:-1], profile[a], out=row)
+        numpy.maximum(row, prev[1:] - gap, out=row)
+        numpy.maximum(row, 0, out=row)
+        cur[0] = 0
+        # horizontal gaps: running maximum of cur[k] - (j-k)*gap
+        cur += colgaps
+        numpy.maximum.accumulate(cur, out=cur)
+        cur -= colgaps
+
+        numpy.putmask(bestrow, cur > best, i+1)
+        numpy.maximum(best, cur, out=best)
+        prev, cur = cur, prev
+
+    return best[1:], bestrow[1:]
+
+
+def _localDP(qcodes, tcodes, subst_matrix, gap):
+    # Full Smith-Waterman table of pointers for a small query x window
+    # problem, PTR_NONE marking where local alignments start
+    n = len(qcodes)
+    m = len(tcodes)
+    profile = targetProfile(tcodes, subst_matrix)
+    colgaps = numpy.arange(m+1, dtype=numpy.int32) * gap
+    TB = numpy.zeros((n+1, m+1), dtype=numpy.int8)
+    H = numpy.zeros((n+1, m+1), dtype=numpy.int32)
+
+    for i in range(1, n+1):
+        diag = H[i-1, :-1] + profile[qcodes[i-1]]
+        up = H[i-1, 1:] - gap
+        cur = H[i]
+        cur[1:] = numpy.maximum(numpy.maximum(diag, up), 0)
+        cur += colgaps
+        numpy.maximum.accumulate(cur, out=cur)
+        cur -= colgaps
+        TB[i, 1:] = numpy.where(cur[1:] == 0, PTR_NONE,
+                    numpy.where(cur[1:] == diag, PTR_BASE,
+                    numpy.where(cur[1:] == up, PTR_GAP2, PTR_GAP1)))
+    return H, TB
+
+
+def _letters(codes):
+    return numpy.frombuffer(b"AGCTN", dtype=numpy.uint8)[codes].tobytes().decode("ascii")
+
+
+def _strandWindow(target, strand):
+    # Function returning the codes of positions lo..end of target on one
+    # strand (- strand coordinates count from the end of the target),
+    # decoding only that window
+    n = len(target)
+    def forward(lo, end):
+        if isinstance(target, packedSeq.PackedSeq):
+            return target.codes(lo, end)
+        return packedSeq.encode(target[lo:end])
+    if strand == "+":
+        return forward
+
+    def reverse(lo, end):
+        rc = forward(n - end, n - lo)[::-1]
+        return numpy.where(rc == packedSeq.N, rc, 3 - rc)
+    return reverse
+
+
+def _hitAt(query, qcodes, window, row, col, score, subst_matrix, gap):
+    # Trace back the hit scoring score that ends at query row and target
+    # column col, widening the target window until it holds the whole hit
+    width = 2*len(query)
+    while True:
+        start = max(0, col + 1 - width)
+        tcodes = window(start, col + 1)
+        H, TB = _localDP(qcodes[:row], tcodes, subst_matrix, gap)
+        if H[row, col+1-start] >= score or start == 0:
+            break
+        width *= 2
+    s1, s2 = traceback(query[:row], _letters(tcodes), TB)
+    qlen = len(s1) - s1.count('-')
+    tlen = len(s2) - s2.count('-')
+    return row - qlen, row, col + 1 - tlen, col + 1, s1, s2
+
+
+def localHits(query, target, subst_matrix=S, gap=gap_penalty, top=5,
+              both_strands=False, min_score=1, chunk_size=1 << 16):
+    """
+    Return up to top non-overlapping local alignments of query in target
+    (strings or PackedSeq), best first, as LocalHit tuples. The target is
+    decoded and scanned in chunks of chunk_size bases, the reverse
+    complement included, so apart from the target itself memory is bounded
+    by the chunk size and not by the target length.
+    """
+    qcodes = encodeSeq(query)
+    query = str(query)
+    if len(qcodes) == 0:
+        return []
+
+    n = len(target)
+    strands = ["+", "-"] if both_strands else ["+"]
+    windows = dict((strand, _strandWindow(target, strand)) for strand in strands)
+
+    # Keep the best column of every query-length block of the target as a
+    # candidate hit end, so that one hit does not fill the candidate list
+    block = len(qcodes)
+    overlap = 2*len(qcodes)
+    candidates = []
+    for strand in strands:
+        for start in range(0, n, chunk_size):
+            lo = max(0, start - overlap)
+            end = min(n, start + chunk_size)
+            codes = windows[strand](lo, end)
+            best, bestrow = _scanChunk(qcodes, targetProfile(codes, subst_matrix), gap)
+            best = best[start-lo:]
+            bestrow = bestrow[start-lo:]
+
+            nblocks = -(-len(best) // block)
+            padded = numpy.zeros(nblocks*block, dtype=best.dtype)
+            padded[:len(best)] = best
+            cols = numpy.argmax(padded.reshape(nblocks, block), axis=1) + numpy.arange(nblocks)*block
+            cols = cols[best[cols] >= min_score]
+            cols = cols[numpy.argsort(-best[cols], kind="mergesort")[:8*top]]
+            for c in cols:
+                candidates.append((int(best[c]), strand, start + int(c), int(bestrow[c])))
+
+    candidates.sort(key=lambda c: (-c[0], c[1], c[2]))
+    hits = []
+    taken = {"+": [], "-": []}
+    for score, strand, col, row in candidates:
+        if len(hits) == top:
+            break
+        if any(ts <= col < te + len(qcodes) for ts, te in taken[strand]):
+            continue
+        qstart, qend, tstart, tend, s1, s2 = _hitAt(query, qcodes, windows[strand], row, col,
+                                                   score, subst_matrix, gap)
+        if any(tstart < te and ts < tend for ts, te in taken[strand]):
+            continue
+        taken[strand].append((tstart, tend))
+        if strand == "-":
+            tstart, tend = n - tend, n - tstart
+        hits.append(LocalHit(score, qstart, qend, tstart, tend, strand, s1, s2))
+
+    return hits
+
+
+def seqalignLocal(seq1, seq2, subst_matrix=S, gap=gap_penalty):
+    """
+    Return the best Smith-Waterman alignment of seq1 and seq2 as a LocalHit,
+    or None when no pair of bases scores above zero.
+    """
+    hits = localHits(seq1, seq2, subst_matrix, gap, top=1)
+    return hits[0] if hits else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("query", help="FASTA file with the query sequence")
+    parser.add_argument("target", help="FASTA file with the target sequence")
+    parser.add_argument("--top", type=int, default=5,
+                        help="number of non-overlapping hits to report (default 5)")
+    parser.add_argument("--both-strands", action="store_true",
+                        help="also search the reverse complement of the target")
+    parser.add_argument("--min-score", type=int, default=1,
+                        help="lowest score to report (default 1)")
+    args = parser.parse_args()
+
+    query = readSeq(args.query)
+    target = readSeq(args.target, packed=True)
+    hits = localHits(query, target, top=args.top, both_strands=args.both_strands,
+                     min_score=args.min_score)
+
+    for hit in hits:
+        print("Score: {0}\tquery {1}-{2}\ttarget {3}-{4}\tstrand {5}".format(
+            hit.score, hit.qstart + 1, hit.qend, hit.tstart + 1, hit.tend, hit.strand))
+        print(hit.s1)
+        print(hit.s2)
+        print("")
+
+if __name__ == "__main__":
+    main()